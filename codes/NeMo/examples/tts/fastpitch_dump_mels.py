@@ -0,0 +1,66 @@
+# Copyright (c) 2021, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Dumps teacher-forced FastPitch mels for HiFi-GAN fine-tuning, one <audio stem>.npy per manifest item.
+
+Single GPU:
+    python fastpitch_dump_mels.py --model fastpitch.nemo --manifest train_manifest.json --out_dir sup_data/pred_mels
+
+Multiple GPUs (one process per device, each process handles a strided slice of the manifest):
+    torchrun --nproc_per_node=4 fastpitch_dump_mels.py --model fastpitch.nemo --manifest ... --out_dir ...
+"""
+
+import os
+from argparse import ArgumentParser
+
+import torch
+
+from nemo.collections.tts.models import FastPitchModel
+from nemo.utils import logging
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--model", required=True, help="Path to a .nemo file or a .ckpt checkpoint")
+    parser.add_argument("--manifest", required=True, help="Manifest to dump mels for")
+    parser.add_argument("--out_dir", required=True, help="Output folder for <audio stem>.npy files")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_workers", type=int, default=4)
+    args = parser.parse_args()
+
+    rank = int(os.environ.get("RANK", 0))
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    device = torch.device(f"cuda:{local_rank}" if torch.cuda.is_available() else "cpu")
+
+    if args.model.endswith(".nemo"):
+        model = FastPitchModel.restore_from(args.model, map_location=device)
+    else:
+        model = FastPitchModel.load_from_checkpoint(args.model, map_location=device)
+    model = model.to(device)
+
+    logging.info(f"Rank {rank}/{world_size} dumping mels on {device}")
+    model.dump_teacher_forced_mels(
+        manifest=args.manifest,
+        out_dir=args.out_dir,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        rank=rank,
+        world_size=world_size,
+    )
+
+
+if __name__ == '__main__':
+    main()
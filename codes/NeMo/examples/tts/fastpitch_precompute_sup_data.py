@@ -0,0 +1,88 @@
+# Copyright (c) 2021, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Fills sup_data_path with the cached supplementary data (log mel, pitch, voiced mask, p_voiced, energy) of the training
+and validation manifests before training, so that the first epoch does not compute them inside dataloader workers.
+Uses the same config as training; files that already exist are skipped, so the script can be re-run at any time.
+
+    python fastpitch_precompute_sup_data.py \
+        train_dataset=./metas/nemo/train_manifest.json \
+        validation_datasets=./metas/nemo/val_manifest.json \
+        sup_data_path=./sup_data \
+        +num_workers=16
+
+Pitch is saved unnormalized, so pitch_mean / pitch_std and bert_path are not needed here.
+"""
+
+from collections import Counter
+
+import torch
+from hydra.utils import instantiate
+from omegaconf import open_dict
+from tqdm import tqdm
+
+from nemo.collections.tts.data.dataset import CACHED_SUP_DATA_TYPES
+from nemo.core.config import hydra_runner
+from nemo.utils import logging
+
+
+class _SupDataJobs(torch.utils.data.Dataset):
+    """Runs TTSDataset.compute_sup_data in dataloader worker processes."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        return self.dataset.compute_sup_data(index)
+
+
+def precompute(dataset_cfg, text_tokenizer, num_workers, name):
+    cached_types = [data_type.name for data_type in CACHED_SUP_DATA_TYPES]
+    with open_dict(dataset_cfg):
+        dataset_cfg.sup_data_types = [t for t in dataset_cfg.sup_data_types if t in cached_types]
+        dataset_cfg.pitch_norm = False
+        for key in ["pitch_mean", "pitch_std", "pitch_stats_path", "bert_path"]:
+            dataset_cfg.pop(key, None)
+
+    if not dataset_cfg.sup_data_types:
+        logging.info(f"No cached supplementary data types configured for {name}, nothing to do.")
+        return
+
+    dataset = instantiate(dataset_cfg, text_tokenizer=text_tokenizer)
+    loader = torch.utils.data.DataLoader(
+        _SupDataJobs(dataset), batch_size=None, shuffle=False, num_workers=num_workers
+    )
+
+    computed = Counter()
+    for names in tqdm(loader, total=len(dataset), desc=f"Precomputing {name}"):
+        computed.update(names)
+    logging.info(
+        f"{name}: {len(dataset)} samples, computed {dict(computed) or 'nothing'} for {dataset_cfg.sup_data_types}."
+    )
+
+
+@hydra_runner(config_path="conf", config_name="fastpitch_align_v1.05_shaanxi")
+def main(cfg):
+    text_tokenizer = instantiate(cfg.model.text_tokenizer)
+    num_workers = cfg.get("num_workers", 8)
+    precompute(cfg.model.train_ds.dataset, text_tokenizer, num_workers, "train")
+    precompute(cfg.model.validation_ds.dataset, text_tokenizer, num_workers, "validation")
+
+
+if __name__ == '__main__':
+    main()  # noqa pylint: disable=no-value-for-parameter
@@ -0,0 +1,74 @@
+# Copyright (c) 2023, NVIDIA CORPORATION & AFFILIATES.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Packs the per-utterance supplementary data files (sup_data_path/<type>/<id>.pt) into one packed store per type,
+written next to the .pt files (sup_data_path/<type>/index.json + shard_*.bin). TTSDataset then reads the items from
+memory-mapped shards instead of opening one file per item, and falls back to .pt files for items not in the store.
+Items already in the store are skipped, so the script can be re-run after adding data.
+
+    python pack_sup_data.py --sup_data_path ./sup_data
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+from tqdm import tqdm
+
+import torch
+
+from nemo.collections.tts.data.dataset import CACHED_SUP_DATA_TYPES
+from nemo.collections.tts.parts.utils.tts_dataset_utils import PackedFeatureWriter
+from nemo.collections.tts.torch.tts_data_types import LogMel
+from nemo.utils import logging
+
+
+def pack_folder(folder, name, dtype, shard_bytes, sync_every=10000):
+    writer = PackedFeatureWriter(folder, dtype=dtype, shard_bytes=shard_bytes)
+    pt_paths = sorted(p for p in folder.glob("*.pt") if p.stem not in writer)
+    for i, pt_path in enumerate(tqdm(pt_paths, desc=f"Packing {name}")):
+        value = torch.load(pt_path, map_location="cpu").float()
+        if name == LogMel.name:
+            # (1, n_mels, T) or (n_mels, T) -> (T, n_mels): the variable-length axis goes first
+            value = value.reshape(-1, value.shape[-1]).T
+        writer.write(pt_path.stem, value.numpy())
+        if (i + 1) % sync_every == 0:
+            writer.flush()
+    writer.close()
+    logging.info(f"Packed {len(pt_paths)} new {name} items into {folder}, the store has {len(writer.index['items'])}.")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sup_data_path", required=True, help="sup_data_path used for training")
+    parser.add_argument(
+        "--types",
+        nargs="+",
+        default=[data_type.name for data_type in CACHED_SUP_DATA_TYPES],
+        help="Supplementary data types to pack; missing folders are skipped",
+    )
+    parser.add_argument("--dtype", default="float32", help="Storage dtype, float16 halves the size of log mels")
+    parser.add_argument("--shard_size_gb", type=float, default=1.0)
+    args = parser.parse_args()
+
+    for name in args.types:
+        folder = Path(args.sup_data_path) / name
+        if not folder.is_dir():
+            logging.info(f"{folder} does not exist, skipping {name}.")
+            continue
+        pack_folder(folder, name, args.dtype, int(args.shard_size_gb * (1 << 30)))
+
+
+if __name__ == '__main__':
+    main()
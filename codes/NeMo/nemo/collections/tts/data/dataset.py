@@ -35,10 +35,13 @@ from nemo.collections.common.tokenizers.text_to_speech.tts_tokenizers import (
     EnglishPhonemesTokenizer,
 )
 from nemo.collections.tts.parts.utils.tts_dataset_utils import (
+    AlignPriorBank,
     BetaBinomialInterpolator,
+    PackedFeatureStore,
     beta_binomial_prior_distribution,
     general_padding,
     get_base_dir,
+    get_mel_length,
 )
 from nemo.collections.tts.torch.tts_data_types import (
     DATA_STR2DATA_CLASS,
@@ -78,6 +81,45 @@ WINDOW_FN_SUPPORTED = {
     'bartlett': torch.bartlett_window,
     'none': None,
 }
+# Supplementary data types which are computed from audio and cached in sup_data_path (see TTSDataset.compute_sup_data)
+CACHED_SUP_DATA_TYPES = [LogMel, Pitch, Voiced_mask, P_voiced, Energy]
+
+
+class SampleFeatures:
+    """Spectral features of one audio sample, computed on first use. The magnitude spectrogram is computed at most
+    once and log mel and energy are derived from it; the mel length is computed analytically unless the spectrogram
+    is already there.
+    """
+
+    def __init__(self, dataset, audio):
+        self.dataset = dataset
+        self.audio = audio
+        self._spec = None
+        self._log_mel = None
+
+    @property
+    def spec(self):
+        if self._spec is None:
+            self._spec = self.dataset.get_spec(self.audio)
+        return self._spec
+
+    @property
+    def log_mel(self):
+        if self._log_mel is None:
+            self._log_mel = self.dataset.spec_to_log_mel(self.spec)
+        return self._log_mel
+
+    @property
+    def energy(self):
+        return torch.linalg.norm(self.spec.squeeze(0), axis=0).float()
+
+    @property
+    def mel_len(self):
+        if self._spec is not None:
+            return self._spec.shape[-1]
+        return get_mel_length(
+            self.audio.shape[0], self.dataset.n_fft, self.dataset.hop_len, center=self.dataset.stft_center
+        )
 
 
 class TTSDataset(Dataset):
@@ -168,6 +210,8 @@ class TTSDataset(Dataset):
             durs_file (Optional[str]): String path to pickled durations location.
             durs_type (Optional[str]): Type of durations. Currently, supported only "aligner-based".
             use_beta_binomial_interpolator (Optional[bool]): Whether to use beta-binomial interpolator for calculating alignment prior matrix. Defaults to False.
+            use_align_prior_bank (Optional[bool]): Whether to prebuild an AlignPriorBank for the length distribution of the dataset, shared by all dataloader workers, instead of the beta-binomial interpolator. Defaults to False.
+            align_prior_bank_path (Optional[Path, str]): File the align prior bank is loaded from if it exists, or saved to after it is built.
             pitch_fmin (Optional[float]): The fmin input to librosa.pyin. Defaults to librosa.note_to_hz('C2').
             pitch_fmax (Optional[float]): The fmax input to librosa.pyin. Defaults to librosa.note_to_hz('C7').
             pitch_mean (Optional[float]): The mean that we use to normalize the pitch.
@@ -310,12 +354,15 @@ class TTSDataset(Dataset):
                 f"Please choose one from {list(WINDOW_FN_SUPPORTED.keys())}."
             )
 
+        # explicit, since mel lengths are also computed analytically from it (see get_mel_length)
+        self.stft_center = True
         self.stft = lambda x: torch.stft(
             input=x,
             n_fft=self.n_fft,
             hop_length=self.hop_len,
             win_length=self.win_length,
             window=window_fn(self.win_length, periodic=False).to(torch.float) if window_fn else None,
+            center=self.stft_center,
             return_complex=True,
         )
 
@@ -341,11 +388,19 @@ class TTSDataset(Dataset):
                 )
 
         self.sup_data_types_set = set(self.sup_data_types)
+        self.pad_multiple = pad_multiple
 
         for data_type in self.sup_data_types:
             getattr(self, f"add_{data_type.name}")(**kwargs)
 
-        self.pad_multiple = pad_multiple
+        # cached supplementary data packed by examples/tts/pack_sup_data.py is read from the store of its folder
+        self.sup_data_stores = {}
+        for data_type in self.sup_data_types:
+            if data_type in CACHED_SUP_DATA_TYPES:
+                folder = getattr(self, f"{data_type.name}_folder")
+                if PackedFeatureStore.exists(folder):
+                    logging.info(f"Using packed {data_type.name} store from {folder}.")
+                    self.sup_data_stores[data_type.name] = PackedFeatureStore(folder)
 
     @staticmethod
     def filter_files(data, ignore_file, min_duration, max_duration, total_duration):
@@ -425,6 +480,32 @@ class TTSDataset(Dataset):
         if self.use_beta_binomial_interpolator:
             self.beta_binomial_interpolator = BetaBinomialInterpolator()
 
+        self.align_prior_bank = None
+        use_align_prior_bank = kwargs.pop('use_align_prior_bank', False)
+        align_prior_bank_path = kwargs.pop('align_prior_bank_path', None)
+        if use_align_prior_bank:
+            if align_prior_bank_path is not None and Path(align_prior_bank_path).exists():
+                self.align_prior_bank = AlignPriorBank.load(align_prior_bank_path)
+            else:
+                self.align_prior_bank = AlignPriorBank().build(self._get_align_prior_lengths())
+                if align_prior_bank_path is not None:
+                    self.align_prior_bank.save(align_prior_bank_path)
+            logging.info(f"Using align prior bank with {len(self.align_prior_bank)} sizes.")
+
+    def _get_align_prior_lengths(self):
+        # samples whose mel length is only known after decoding fall back to priors computed in the worker
+        lengths = []
+        for sample in self.data:
+            mel_len = self.get_mel_len_from_duration(sample)
+            if mel_len is None:
+                continue
+            if "text_tokens" in sample:
+                text_len = len(sample["text_tokens"])
+            else:
+                text_len = len(self.text_tokenizer(sample["normalized_text"]))
+            lengths.append((mel_len, text_len))
+        return lengths
+
     def add_pitch(self, **kwargs):
         self.pitch_folder = kwargs.pop('pitch_folder', None)
 
@@ -491,6 +572,12 @@ class TTSDataset(Dataset):
     def add_bert_feats(self, **kwargs):
         self.bert_path = kwargs.pop('bert_path', None)
 
+        # bert_path may hold one .npy per utterance or a packed fp16 store with an index.json
+        self.bert_store = None
+        if PackedFeatureStore.exists(self.bert_path):
+            logging.info(f"Using packed BERT feature store from {self.bert_path}.")
+            self.bert_store = PackedFeatureStore(self.bert_path)
+
     def add_emotions(self, **kwargs):
         self.emotion_path = kwargs.pop('emotion_path', None)
 
@@ -502,13 +589,15 @@ class TTSDataset(Dataset):
             spec = torch.sqrt(spec.pow(2).sum(-1) + EPSILON)
         return spec
 
-    def get_log_mel(self, audio):
+    def spec_to_log_mel(self, spec):
         with torch.cuda.amp.autocast(enabled=False):
-            spec = self.get_spec(audio)
             mel = torch.matmul(self.fb.to(spec.dtype), spec)
             log_mel = torch.log(torch.clamp(mel, min=torch.finfo(mel.dtype).tiny))
         return log_mel
 
+    def get_log_mel(self, audio):
+        return self.spec_to_log_mel(self.get_spec(audio))
+
     def pitch_shift(self, audio, sr, rel_audio_path_as_text_id):
         audio_shifted_path = Path(self.sup_data_path) / f"{rel_audio_path_as_text_id}_pitch_shift.pt"
         if audio_shifted_path.exists() and self.cache_pitch_augment:
@@ -522,7 +611,7 @@ class TTSDataset(Dataset):
             # save audio_shifted
             audio_shifted = torch.tensor(audio_shifted)
             if self.cache_pitch_augment:
-                torch.save(audio_shifted, audio_shifted_path)
+                self._save_sup_data(audio_shifted, audio_shifted_path)
             return audio_shifted
 
     def _pad_wav_to_multiple(self, wav):
@@ -533,12 +622,145 @@ class TTSDataset(Dataset):
                 )
         return wav
 
-    def __getitem__(self, index):
-        sample = self.data[index]
+    def get_mel_len_from_duration(self, sample):
+        """Mel length of a sample derived from its manifest duration, without decoding the audio.
+        Returns None if the manifest has no duration or the audio is trimmed or segmented, since then the length is
+        only known after loading the audio.
+        """
+        duration = sample.get("duration")
+        if duration is None or self.trim:
+            return None
+        if self.segment_max_duration is not None and duration > self.segment_max_duration:
+            return None
+        num_samples = int(round(duration * self.sample_rate))
+        if self.pad_multiple > 1:
+            num_samples = math.ceil(num_samples / self.pad_multiple) * self.pad_multiple
+        return get_mel_length(num_samples, self.n_fft, self.hop_len, center=self.stft_center)
 
+    def _get_rel_audio_path_as_text_id(self, sample):
         # Let's keep audio name and all internal directories in rel_audio_path_as_text_id to avoid any collisions
         rel_audio_path = Path(sample["audio_filepath"]).relative_to(self.base_data_dir).with_suffix("")
-        rel_audio_path_as_text_id = str(rel_audio_path).replace("/", "_")
+        return str(rel_audio_path).replace("/", "_")
+
+    @staticmethod
+    def _save_sup_data(value, path):
+        """Saves through a temporary file and an atomic rename, so a concurrent reader never sees a partial file."""
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        torch.save(value, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _load_audio(self, sample):
+        features = self.featurizer.process(
+            sample["audio_filepath"],
+            trim=self.trim,
+            trim_ref=self.trim_ref,
+            trim_top_db=self.trim_top_db,
+            trim_frame_length=self.trim_frame_length,
+            trim_hop_length=self.trim_hop_length,
+        )
+
+        if self.pad_multiple > 1:
+            features = self._pad_wav_to_multiple(features)
+        return features
+
+    def _log_mel_filepath(self, sample, rel_audio_path_as_text_id):
+        mel_path = sample["mel_filepath"]
+        if mel_path is not None and Path(mel_path).exists():
+            return Path(mel_path)
+        return self.log_mel_folder / f"{rel_audio_path_as_text_id}.pt"
+
+    def _voiced_filepaths(self, rel_audio_path_as_text_id):
+        # pitch, voiced_mask and p_voiced are all computed from the same pyworld f0 track
+        return [
+            (voiced_item.name, getattr(self, f"{voiced_item.name}_folder") / f"{rel_audio_path_as_text_id}.pt")
+            for voiced_item in [Pitch, Voiced_mask, P_voiced]
+            if voiced_item in self.sup_data_types_set
+        ]
+
+    def _energy_filepath(self, rel_audio_path_as_text_id):
+        return self.energy_folder / f"{rel_audio_path_as_text_id}.pt"
+
+    def _in_sup_data_store(self, name, filepath):
+        store = self.sup_data_stores.get(name)
+        return (
+            store is not None
+            and filepath.parent == Path(getattr(self, f"{name}_folder"))
+            and filepath.stem in store
+        )
+
+    def _load_sup_data(self, name, filepath):
+        """Loads cached supplementary data from the packed store of its type if the store has it, else from its .pt
+        file. Returns None if neither exists."""
+        if self._in_sup_data_store(name, filepath):
+            # no copy for float32 stores
+            value = torch.from_numpy(self.sup_data_stores[name][filepath.stem]).float()
+            # log mels are packed as (T, n_mels) so that the variable-length axis comes first
+            return value.T if name == LogMel.name else value
+        if filepath.exists():
+            return torch.load(filepath)
+        return None
+
+    def _compute_pitch(self, audio, mel_len):
+        pw_audio = audio.numpy().astype(np.float64)
+        pitch, t = pw.dio(
+            pw_audio,
+            self.sample_rate,
+            frame_period= self.hop_length / self.sample_rate * 1000,
+        )
+        pitch = pw.stonemask(pw_audio, pitch, t, self.sample_rate).astype(np.float32)
+        if pitch.shape[0] < mel_len:
+            pitch = np.pad(pitch, [0, mel_len - pitch.shape[0]], 'constant', constant_values=pitch[-1])
+        else:
+            pitch = pitch[:mel_len]
+        return torch.from_numpy(pitch).float()
+
+    def compute_sup_data(self, index):
+        """Computes and saves the cached supplementary data (see CACHED_SUP_DATA_TYPES) of one sample if it is
+        missing in sup_data_path. Used to fill sup_data_path before training instead of lazily in the first epoch.
+
+        Args:
+            index (int): Index of the sample in the dataset.
+
+        Returns:
+            List of names of the supplementary data types computed for this sample, empty if all of them were saved.
+        """
+        sample = self.data[index]
+        rel_audio_path_as_text_id = self._get_rel_audio_path_as_text_id(sample)
+
+        missing = []
+        if LogMel in self.sup_data_types_set:
+            missing.append((LogMel.name, self._log_mel_filepath(sample, rel_audio_path_as_text_id)))
+        missing.extend(self._voiced_filepaths(rel_audio_path_as_text_id))
+        if Energy in self.sup_data_types_set:
+            missing.append((Energy.name, self._energy_filepath(rel_audio_path_as_text_id)))
+        missing = [
+            (name, filepath)
+            for name, filepath in missing
+            if not filepath.exists() and not self._in_sup_data_store(name, filepath)
+        ]
+        if not missing:
+            return []
+
+        audio = self._load_audio(sample)
+        sample_features = SampleFeatures(self, audio)
+        pitch = None
+        for name, filepath in missing:
+            if name == LogMel.name:
+                value = sample_features.log_mel
+            elif name == Energy.name:
+                value = sample_features.energy
+            else:
+                if pitch is None:
+                    pitch = self._compute_pitch(audio, sample_features.mel_len)
+                value = pitch
+            self._save_sup_data(value, filepath)
+
+        return [name for name, _ in missing]
+
+    def __getitem__(self, index):
+        sample = self.data[index]
+        rel_audio_path_as_text_id = self._get_rel_audio_path_as_text_id(sample)
 
         if (
             self.segment_max_duration is not None
@@ -560,17 +782,7 @@ class TTSDataset(Dataset):
                 features = self._pad_wav_to_multiple(features)
             audio, audio_length = features, torch.tensor(features.shape[0]).long()
         else:
-            features = self.featurizer.process(
-                sample["audio_filepath"],
-                trim=self.trim,
-                trim_ref=self.trim_ref,
-                trim_top_db=self.trim_top_db,
-                trim_frame_length=self.trim_frame_length,
-                trim_hop_length=self.trim_hop_length,
-            )
-
-            if self.pad_multiple > 1:
-                features = self._pad_wav_to_multiple(features)
+            features = self._load_audio(sample)
             audio_shifted = None
             if self.pitch_augment:
                 audio_shifted = self.pitch_shift(
@@ -595,21 +807,17 @@ class TTSDataset(Dataset):
             text = torch.tensor(tokenized).long()
             text_length = torch.tensor(len(tokenized)).long()
 
+        sample_features = SampleFeatures(self, audio)
+
         # Load mel if needed
         log_mel, log_mel_length = None, None
         if LogMel in self.sup_data_types_set:
-            mel_path = sample["mel_filepath"]
+            mel_path = self._log_mel_filepath(sample, rel_audio_path_as_text_id)
+            log_mel = self._load_sup_data(LogMel.name, mel_path)
 
-            if mel_path is not None and Path(mel_path).exists():
-                log_mel = torch.load(mel_path)
-            else:
-                mel_path = self.log_mel_folder / f"{rel_audio_path_as_text_id}.pt"
-
-                if mel_path.exists():
-                    log_mel = torch.load(mel_path)
-                else:
-                    log_mel = self.get_log_mel(audio)
-                    torch.save(log_mel, mel_path)
+            if log_mel is None:
+                log_mel = sample_features.log_mel
+                self._save_sup_data(log_mel, mel_path)
 
             log_mel = log_mel.squeeze(0)
             log_mel_length = torch.tensor(log_mel.shape[1]).long()
@@ -622,43 +830,33 @@ class TTSDataset(Dataset):
         # Load alignment prior matrix if needed
         align_prior_matrix = None
         if AlignPriorMatrix in self.sup_data_types_set:
-            mel_len = self.get_log_mel(audio).shape[2]
-            if self.use_beta_binomial_interpolator:
+            mel_len = sample_features.mel_len
+            if self.align_prior_bank is not None:
+                align_prior_matrix = self.align_prior_bank(mel_len, text_length.item())
+            elif self.use_beta_binomial_interpolator:
                 align_prior_matrix = torch.from_numpy(self.beta_binomial_interpolator(mel_len, text_length.item()))
             else:
                 align_prior_matrix = torch.from_numpy(beta_binomial_prior_distribution(text_length, mel_len))
 
-        non_exist_voiced_index = []
-        my_var = locals()
-        for i, voiced_item in enumerate([Pitch, Voiced_mask, P_voiced]):
-            if voiced_item in self.sup_data_types_set:
-                voiced_folder = getattr(self, f"{voiced_item.name}_folder")
-                voiced_filepath = voiced_folder / f"{rel_audio_path_as_text_id}.pt"
-                if voiced_filepath.exists():
-                    my_var.__setitem__(voiced_item.name, torch.load(voiced_filepath).float())
-                else:
-                    non_exist_voiced_index.append((i, voiced_item.name, voiced_filepath))
-
-        if len(non_exist_voiced_index) != 0:
-            pw_audio = audio.numpy().astype(np.float64)
-            pitch, t = pw.dio(
-                pw_audio,
-                self.sample_rate,
-                frame_period= self.hop_length / self.sample_rate * 1000,
-            )
-            pitch = pw.stonemask(pw_audio, pitch, t, self.sample_rate).astype(np.float32)
-            if pitch.shape[0] < mel_len:
-                pitch = np.pad(pitch, [0, mel_len - pitch.shape[0]], 'constant', constant_values=pitch[-1])
+        voiced = {}
+        non_exist_voiced_filepaths = []
+        for voiced_name, voiced_filepath in self._voiced_filepaths(rel_audio_path_as_text_id):
+            voiced_value = self._load_sup_data(voiced_name, voiced_filepath)
+            if voiced_value is not None:
+                voiced[voiced_name] = voiced_value.float()
             else:
-                pitch = pitch[:mel_len]
-            for (i, voiced_name, voiced_filepath) in non_exist_voiced_index:
-                my_var.__setitem__(voiced_name, torch.from_numpy(pitch).float())
-                torch.save(my_var.get(voiced_name), voiced_filepath)
+                non_exist_voiced_filepaths.append((voiced_name, voiced_filepath))
+
+        if len(non_exist_voiced_filepaths) != 0:
+            voiced_values = self._compute_pitch(audio, sample_features.mel_len)
+            for voiced_name, voiced_filepath in non_exist_voiced_filepaths:
+                voiced[voiced_name] = voiced_values
+                self._save_sup_data(voiced_values, voiced_filepath)
 
-        pitch = my_var.get('pitch', None)
-        pitch_length = my_var.get('pitch_length', None)
-        voiced_mask = my_var.get('voiced_mask', None)
-        p_voiced = my_var.get('p_voiced', None)
+        pitch = voiced.get(Pitch.name, None)
+        pitch_length = None
+        voiced_mask = voiced.get(Voiced_mask.name, None)
+        p_voiced = voiced.get(P_voiced.name, None)
 
         # normalize pitch if requested.
         if pitch is not None:
@@ -679,21 +877,22 @@ class TTSDataset(Dataset):
                 else:
                     raise ValueError(f"Missing statistics for pitch normalization.")
 
-                pitch -= sample_pitch_mean
+                # not in place: pitch may be a view into a packed store or shared with voiced_mask / p_voiced
+                pitch = pitch - sample_pitch_mean
                 pitch[pitch == -sample_pitch_mean] = 0.0  # Zero out values that were previously zero
                 pitch /= sample_pitch_std
 
         # Load energy if needed
         energy, energy_length = None, None
         if Energy in self.sup_data_types_set:
-            energy_path = self.energy_folder / f"{rel_audio_path_as_text_id}.pt"
+            energy_path = self._energy_filepath(rel_audio_path_as_text_id)
+            energy = self._load_sup_data(Energy.name, energy_path)
 
-            if energy_path.exists():
-                energy = torch.load(energy_path).float()
+            if energy is not None:
+                energy = energy.float()
             else:
-                spec = self.get_spec(audio)
-                energy = torch.linalg.norm(spec.squeeze(0), axis=0).float()
-                torch.save(energy, energy_path)
+                energy = sample_features.energy
+                self._save_sup_data(energy, energy_path)
 
             energy_length = torch.tensor(len(energy)).long()
 
@@ -709,8 +908,12 @@ class TTSDataset(Dataset):
 
         bert_feat = None
         if BertFeats in self.sup_data_types_set:
-            _path = os.path.join(self.bert_path, os.path.basename(sample['audio_filepath']).split(".")[0] + '.npy')
-            bert_feat = torch.from_numpy(np.load(_path).T) # C, T
+            audio_stem = os.path.basename(sample['audio_filepath']).split(".")[0]
+            if self.bert_store is not None:
+                bert_feat = torch.from_numpy(self.bert_store[audio_stem]).T.float() # C, T
+            else:
+                _path = os.path.join(self.bert_path, audio_stem + '.npy')
+                bert_feat = torch.from_numpy(np.load(_path).T) # C, T
             if not self.text_tokenizer.pad_with_space:
                 bert_feat = bert_feat[:, 1:-1]
             assert bert_feat.shape[1] == text_length.item() 
@@ -32,6 +32,7 @@ from nemo.collections.tts.parts.utils.helpers import (
     plot_spectrogram_to_numpy,
     process_batch,
     sample_tts_input,
+    to_device_recursive,
 )
 from nemo.core.classes import Exportable
 from nemo.core.classes.common import PretrainedModelInfo, typecheck
@@ -51,6 +52,7 @@ from nemo.core.neural_types.neural_type import NeuralType
 from nemo.utils import logging, model_utils
 
 import os
+from pathlib import Path
 import soundfile as sf
 import numpy as np
 
@@ -573,6 +575,104 @@ class FastPitchModel(SpectrogramGenerator, Exportable):
             )
             self.log_train_images = True
 
+    def dump_teacher_forced_mels(
+        self,
+        manifest: str,
+        out_dir: str,
+        batch_size: int = 32,
+        num_workers: int = 4,
+        rank: int = 0,
+        world_size: int = 1,
+        dataset_cfg: Optional[DictConfig] = None,
+    ) -> int:
+        """Runs teacher-forced inference over a manifest and saves one predicted mel per item.
+
+        Durations come from the aligner on the ground-truth spectrogram and pitch is predicted, which is what the
+        ``get_mel_result`` training mode produces, but every item of every batch is written to
+        ``<out_dir>/<audio stem>.npy`` with shape (n_mels, T) trimmed to its true length.
+        For multi-GPU dumping, launch one process per device and pass ``rank``/``world_size``; each process handles
+        the items with ``index % world_size == rank``.
+
+        Args:
+            manifest: Path to the manifest to dump mels for.
+            out_dir: Output folder for the .npy files.
+            batch_size: Number of items per forward pass.
+            num_workers: Number of dataloader workers.
+            rank: Index of this process.
+            world_size: Total number of processes.
+            dataset_cfg: Dataset config to instantiate, defaults to ``train_ds.dataset`` of this model.
+
+        Returns:
+            Number of mels written by this process.
+        """
+        if not self.learn_alignment or self.ds_class_name != "TTSDataset":
+            raise ValueError("dump_teacher_forced_mels() requires a TTSDataset model with learn_alignment=True")
+
+        if dataset_cfg is None:
+            dataset_cfg = self._cfg.train_ds.dataset
+        dataset_cfg = OmegaConf.create(OmegaConf.to_container(dataset_cfg, resolve=True))
+        with open_dict(dataset_cfg):
+            dataset_cfg.manifest_filepath = manifest
+            # Every item in the manifest needs a mel, so no duration filtering here.
+            dataset_cfg.min_duration = None
+            dataset_cfg.max_duration = None
+            dataset_cfg.ignore_file = None
+
+        phon_mode = contextlib.nullcontext()
+        if hasattr(self.vocab, "set_phone_prob"):
+            phon_mode = self.vocab.set_phone_prob(prob=None)
+        with phon_mode:
+            dataset = instantiate(
+                dataset_cfg,
+                text_normalizer=self.normalizer,
+                text_normalizer_call_kwargs=self.text_normalizer_call_kwargs,
+                text_tokenizer=self.vocab,
+            )
+
+        indices = list(range(rank, len(dataset), world_size))
+        index_batches = [indices[i : i + batch_size] for i in range(0, len(indices), batch_size)]
+        loader = torch.utils.data.DataLoader(
+            dataset, batch_sampler=index_batches, collate_fn=dataset.collate_fn, num_workers=num_workers,
+        )
+
+        os.makedirs(out_dir, exist_ok=True)
+        was_training = self.training
+        self.eval()
+        written = 0
+        try:
+            with torch.inference_mode():
+                for batch_indices, batch in zip(index_batches, loader):
+                    batch_dict = process_batch(to_device_recursive(batch, self.device), dataset.sup_data_types_set)
+                    mels, spec_len = self.preprocessor(
+                        input_signal=batch_dict["audio"], length=batch_dict["audio_lens"]
+                    )
+                    mels_pred, *_ = self(
+                        text=batch_dict["text"],
+                        phoneme_length_sequences=batch_dict.get("phoneme_length_sequences", None),
+                        emotions=batch_dict.get("emotions", None),
+                        durs=None,
+                        pitch=None,
+                        energy=batch_dict.get("energy", None),
+                        speaker=batch_dict.get("speaker_id", None),
+                        pace=1.0,
+                        spec=mels,
+                        attn_prior=batch_dict.get("align_prior_matrix", None),
+                        mel_lens=spec_len,
+                        input_lens=batch_dict["text_lens"],
+                        bert_feats=batch_dict.get("bert_feats", None),
+                    )
+                    mels_pred = mels_pred.float().cpu().numpy()
+                    spec_len = spec_len.cpu().tolist()
+                    for row, index in enumerate(batch_indices):
+                        stem = Path(dataset.data[index]["audio_filepath"]).stem
+                        np.save(os.path.join(out_dir, f"{stem}.npy"), mels_pred[row, :, : spec_len[row]])
+                        written += 1
+        finally:
+            self.train(was_training)
+
+        logging.info(f"Rank {rank}: wrote {written} teacher-forced mels to {out_dir}")
+        return written
+
     def __setup_dataloader_from_config(self, cfg, shuffle_should_be: bool = True, name: str = "train"):
         if "dataset" not in cfg or not isinstance(cfg.dataset, DictConfig):
             raise ValueError(f"No dataset for {name}")
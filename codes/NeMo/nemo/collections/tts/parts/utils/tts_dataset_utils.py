@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import functools
+import json
 import os
 from pathlib import Path
 from typing import Tuple
@@ -44,6 +45,17 @@ def get_sup_data_file_path(entry: dict, base_audio_path: Path, sup_data_path: Pa
     return file_path
 
 
+def get_mel_length(num_samples, n_fft: int, hop_length: int, center: bool = True):
+    """Number of STFT frames of ``torch.stft`` for ``num_samples`` audio samples.
+    Works for ints as well as numpy arrays and tensors of lengths.
+
+    With ``center=True`` the signal is padded by ``n_fft // 2`` samples on both sides before framing.
+    """
+    if center:
+        num_samples = num_samples + 2 * (n_fft // 2)
+    return 1 + (num_samples - n_fft) // hop_length
+
+
 def normalize_volume(audio: np.array, volume_level: float) -> np.array:
     """Apply peak normalization to the input audio.
     """
@@ -81,6 +93,206 @@ class BetaBinomialInterpolator:
         return ret
 
 
+class AlignPriorBank:
+    """
+    Alternative to ``BetaBinomialInterpolator`` whose priors are built once for all rounded (mel_len, text_len) sizes
+    of a dataset and kept in one flat tensor in shared memory, so dataloader workers share the bank instead of each
+    filling its own cache. The bank can be saved to and loaded from disk. A prior of any size is bilinearly
+    interpolated from the bank entry of its rounded size, like the ``ndimage.zoom(order=1)`` of the interpolator.
+    Sizes that are not in the bank are computed on the fly and cached in the worker.
+    """
+
+    def __init__(self, round_mel_len_to=50, round_text_len_to=10):
+        self.round_mel_len_to = round_mel_len_to
+        self.round_text_len_to = round_text_len_to
+        self.data = torch.zeros(0)
+        self.offsets = {}  # (rounded mel_len, rounded text_len) -> offset of the prior in data
+        self._extra = {}
+
+    def _round_size(self, mel_len, text_len):
+        return (
+            BetaBinomialInterpolator.round(mel_len, to=self.round_mel_len_to),
+            BetaBinomialInterpolator.round(text_len, to=self.round_text_len_to),
+        )
+
+    @staticmethod
+    def _compute(bw, bh):
+        # same prior as BetaBinomialInterpolator.bank(bw, bh).T, shape (bw, bh)
+        return torch.from_numpy(beta_binomial_prior_distribution(bw, bh)).float().T.contiguous()
+
+    def build(self, lengths):
+        """Builds the priors for all rounded sizes of ``lengths``, an iterable of (mel_len, text_len)."""
+        sizes = sorted({self._round_size(mel_len, text_len) for mel_len, text_len in lengths})
+        priors, offset = [], 0
+        for bw, bh in sizes:
+            self.offsets[(bw, bh)] = offset
+            priors.append(self._compute(bw, bh).flatten())
+            offset += bw * bh
+        self.data = torch.cat(priors) if priors else torch.zeros(0)
+        self.data.share_memory_()
+        return self
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def save(self, path):
+        torch.save(
+            {
+                "round_mel_len_to": self.round_mel_len_to,
+                "round_text_len_to": self.round_text_len_to,
+                "sizes": [[bw, bh, offset] for (bw, bh), offset in self.offsets.items()],
+                "data": self.data,
+            },
+            path,
+        )
+
+    @classmethod
+    def load(cls, path):
+        state = torch.load(path)
+        bank = cls(state["round_mel_len_to"], state["round_text_len_to"])
+        bank.offsets = {(bw, bh): offset for bw, bh, offset in state["sizes"]}
+        bank.data = state["data"]
+        bank.data.share_memory_()
+        return bank
+
+    def _prior(self, bw, bh):
+        offset = self.offsets.get((bw, bh))
+        if offset is not None:
+            return self.data[offset : offset + bw * bh].view(bw, bh)
+        if (bw, bh) not in self._extra:
+            self._extra[(bw, bh)] = self._compute(bw, bh)
+        return self._extra[(bw, bh)]
+
+    def __call__(self, w, h):
+        """Returns the (w, h) = (mel_len, text_len) alignment prior as a float tensor."""
+        prior = self._prior(*self._round_size(w, h))
+        ret = torch.nn.functional.interpolate(prior[None, None], size=(w, h), mode="bilinear", align_corners=True)
+        return ret[0, 0]
+
+
+class PackedFeatureStore:
+    """
+    Read-only view over a packed feature store: raw row-major shard files plus an ``index.json`` that maps a key
+    (audio stem) to ``[shard_id, row_offset, n_rows]``. Shards are memory-mapped lazily, so each worker process
+    opens its own maps and every lookup returns a view into the map without copying.
+    Stores are written by ``data_processor/features/feature_store.py`` (BERT features) or ``PackedFeatureWriter``
+    (supplementary data, see ``examples/tts/pack_sup_data.py``).
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / self.INDEX_FILE, 'r', encoding="utf-8") as f:
+            index = json.load(f)
+        self.dtype = np.dtype(index["dtype"])
+        self.row_shape = tuple(index["row_shape"] or ())
+        self.shards = index["shards"]
+        self.items = index["items"]
+        self._memmaps = {}
+
+    @staticmethod
+    def exists(path) -> bool:
+        return path is not None and (Path(path) / PackedFeatureStore.INDEX_FILE).is_file()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def _shard(self, shard_id):
+        if shard_id not in self._memmaps:
+            # copy-on-write mode keeps the arrays writable for torch.from_numpy without touching the file
+            data = np.memmap(self.path / self.shards[shard_id], dtype=self.dtype, mode='c')
+            self._memmaps[shard_id] = data.reshape(-1, *self.row_shape)
+        return self._memmaps[shard_id]
+
+    def __getitem__(self, key) -> np.ndarray:
+        shard_id, offset, n_rows = self.items[key]
+        return self._shard(shard_id)[offset : offset + n_rows]
+
+    def __getstate__(self):
+        # memory maps are reopened in each dataloader worker
+        state = self.__dict__.copy()
+        state["_memmaps"] = {}
+        return state
+
+
+class PackedFeatureWriter:
+    """
+    Writes a store readable by ``PackedFeatureStore``, in the same format as the BERT feature stores written by
+    ``data_processor/features/feature_store.py``. The first axis of every array is its variable-length axis.
+    If ``path`` already holds a store, new items are appended to it in new shards.
+    """
+
+    def __init__(self, path, dtype="float32", shard_bytes=1 << 30):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.shard_bytes = shard_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        if PackedFeatureStore.exists(self.path):
+            with open(self.path / PackedFeatureStore.INDEX_FILE, 'r', encoding="utf-8") as f:
+                self.index = json.load(f)
+            if np.dtype(self.index["dtype"]) != self.dtype:
+                raise ValueError(f"Feature store {self.path} uses dtype {self.index['dtype']}, not {self.dtype}")
+        else:
+            self.index = {"version": 1, "dtype": self.dtype.name, "row_shape": None, "shards": [], "items": {}}
+
+        self._file = None
+        self._shard_rows = 0
+        self._shard_size = 0
+
+    def __contains__(self, key):
+        return key in self.index["items"]
+
+    def _open_shard(self):
+        self._close_shard()
+        name = f"shard_{len(self.index['shards']):05d}.bin"
+        self.index["shards"].append(name)
+        self._file = open(self.path / name, "wb")
+        self._shard_rows = 0
+        self._shard_size = 0
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def write(self, key, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        row_shape = list(array.shape[1:])
+        if self.index["row_shape"] is None:
+            self.index["row_shape"] = row_shape
+        elif self.index["row_shape"] != row_shape:
+            raise ValueError(f"Expected rows of shape {self.index['row_shape']}, got {row_shape} for {key}")
+
+        if self._file is None or (self._shard_size > 0 and self._shard_size + array.nbytes > self.shard_bytes):
+            self._open_shard()
+        self._file.write(array.tobytes())
+        self.index["items"][key] = [len(self.index["shards"]) - 1, self._shard_rows, array.shape[0]]
+        self._shard_rows += array.shape[0]
+        self._shard_size += array.nbytes
+
+    def flush(self):
+        """Syncs the current shard and atomically replaces the index."""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        index_path = self.path / PackedFeatureStore.INDEX_FILE
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def close(self):
+        self.flush()
+        self._close_shard()
+
+
 def general_padding(item, item_len, max_len, pad_value=0):
     if item_len < max_len:
         item = torch.nn.functional.pad(item, (0, max_len - item_len), value=pad_value)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+检查生成的清单，找出训练时会出错的条目
+音频缺失或时长为0、BERT特征缺失或行数与音素数不一致、phoneme_length 长度不一致等，
+结果保存为 TTSDataset 的 ignore_file（音频路径列表的pickle）
+"""
+import os
+import json
+import pickle
+import argparse
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+
+import numpy as np
+from tqdm import tqdm
+
+from features.audio_processor import get_audio_duration
+from features.feature_store import INDEX_FILE, feature_key
+
+# 子进程中的检查配置，由 _init_worker 设置
+_options = None
+_store_items = None
+
+def _load_store_items(bert_path):
+    """分片特征库的索引 {键: [分片号, 起始行, 行数]}，不是分片库时返回 None"""
+    index_path = os.path.join(bert_path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, encoding="utf-8") as f:
+        return json.load(f)["items"]
+
+def _bert_rows(bert_path, audio_filepath):
+    """BERT特征的行数（含首尾[CLS]/[SEP]），特征不存在时返回 None"""
+    key = feature_key(audio_filepath)
+    if _store_items is not None:
+        item = _store_items.get(key)
+        return item[2] if item is not None else None
+    path = os.path.join(bert_path, key + ".npy")
+    if not os.path.exists(path):
+        return None
+    # 只读取文件头
+    return np.load(path, mmap_mode="r").shape[0]
+
+def audit_item(item, options):
+    """检查一条清单，返回发现的问题列表"""
+    problems = []
+    audio_filepath = item.get("audio_filepath")
+    if not audio_filepath or not os.path.exists(audio_filepath):
+        return ["missing_audio"]
+
+    duration = item.get("duration")
+    if not duration or duration <= 0:
+        problems.append("zero_duration")
+    if options["probe_audio"]:
+        try:
+            actual = get_audio_duration(audio_filepath)
+            if actual <= 0:
+                problems.append("empty_audio")
+            elif duration and abs(actual - duration) > options["duration_tolerance"]:
+                problems.append("duration_mismatch")
+        except Exception:
+            problems.append("unreadable_audio")
+
+    # 与 SplitTokenizer 一致：音素以空格分隔
+    phonemes = item.get("normalized_text", "").split()
+    if not phonemes:
+        problems.append("empty_text")
+
+    phoneme_length = item.get("phoneme_length")
+    if phoneme_length is not None and len(phoneme_length) != len(phonemes):
+        problems.append("phoneme_length_mismatch")
+
+    if options["bert_path"]:
+        rows = _bert_rows(options["bert_path"], audio_filepath)
+        if rows is None:
+            problems.append("missing_bert")
+        else:
+            # TTSDataset 中 pad_with_space 时[CLS]/[SEP]对应首尾的空格token，否则去掉这两行，
+            # 两种情况下都要求特征行数等于音素数+2
+            if rows != len(phonemes) + 2:
+                problems.append("bert_length_mismatch")
+    return problems
+
+def _init_worker(options):
+    global _options, _store_items
+    _options = options
+    _store_items = _load_store_items(options["bert_path"]) if options["bert_path"] else None
+
+def _audit_chunk(lines):
+    results = []
+    for line in lines:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            results.append((None, ["invalid_json"]))
+            continue
+        try:
+            results.append((item.get("audio_filepath"), audit_item(item, _options)))
+        except Exception as e:
+            results.append((item.get("audio_filepath"), [f"error: {e}"]))
+    return results
+
+def _iter_chunks(manifest_paths, size):
+    for path in manifest_paths:
+        with open(path, encoding="utf-8") as f:
+            lines = (line for line in f if line.strip())
+            while True:
+                chunk = list(islice(lines, size))
+                if not chunk:
+                    break
+                yield chunk
+
+def audit_manifests(manifest_paths, options, workers=8, report_path=None):
+    """检查清单中的所有条目，返回 (有问题的音频路径列表, 各类问题的计数, 检查的条目数)"""
+    bad_paths = []
+    counter = Counter()
+    total = 0
+    chunks = _iter_chunks(manifest_paths, 256)
+
+    pool = None
+    if workers > 1:
+        pool = Pool(workers, initializer=_init_worker, initargs=(options,))
+        results = pool.imap(_audit_chunk, chunks)
+    else:
+        _init_worker(options)
+        results = map(_audit_chunk, chunks)
+
+    report = open(report_path, "w", encoding="utf-8") if report_path else None
+    try:
+        with tqdm(desc="检查清单") as progress:
+            for chunk_results in results:
+                for audio_filepath, problems in chunk_results:
+                    total += 1
+                    if not problems:
+                        continue
+                    counter.update(problems)
+                    if audio_filepath is not None:
+                        bad_paths.append(audio_filepath)
+                    if report is not None:
+                        report.write(json.dumps({"audio_filepath": audio_filepath, "problems": problems},
+                                                ensure_ascii=False) + "\n")
+                progress.update(len(chunk_results))
+    finally:
+        if report is not None:
+            report.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return bad_paths, counter, total
+
+def main():
+    parser = argparse.ArgumentParser(description="检查清单并生成 TTSDataset 的 ignore_file")
+    parser.add_argument("manifest_path", nargs="+", help="要检查的清单路径，可以有多个")
+    parser.add_argument("--ignore_file", required=True, help="输出的ignore_file路径（音频路径列表的pickle）")
+    parser.add_argument("--bert_path", help="BERT特征目录（.npy或分片特征库），不指定时不检查BERT特征")
+    parser.add_argument("--probe_audio", action="store_true", help="读取音频文件头，检查实际时长")
+    parser.add_argument("--duration_tolerance", type=float, default=0.05,
+                        help="--probe_audio 时清单时长与实际时长允许的误差（秒），默认为0.05")
+    parser.add_argument("--workers", type=int, default=8, help="并行进程数，默认为8")
+    parser.add_argument("--report", help="逐条问题报告的输出路径（JSONL）")
+
+    args = parser.parse_args()
+
+    options = {
+        "bert_path": args.bert_path,
+        "probe_audio": args.probe_audio,
+        "duration_tolerance": args.duration_tolerance,
+    }
+    bad_paths, counter, total = audit_manifests(args.manifest_path, options, args.workers, args.report)
+
+    with open(args.ignore_file, "wb") as f:
+        pickle.dump(bad_paths, f)
+
+    print(f"检查完成：共 {total} 条，有问题 {len(bad_paths)} 条")
+    for problem, count in counter.most_common():
+        print(f"  {problem}: {count}")
+    print(f"ignore_file 已保存到 {args.ignore_file}，在数据集配置中设置 ignore_file 即可跳过这些条目")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,132 @@
-from typing import Dict, List, Optional, Tuple
-import jieba
-from pypinyin import lazy_pinyin, Style
+import os
+import json
+import hashlib
+from typing import Dict, List, NamedTuple, Optional
 
-from .phonetic_rules import INITIAL_RULES, FINAL_RULES, TONE_RULES, BASE_DIALECT_DICT
+from .dialect_rules import DialectRules, xian_rules
+from .frontend import PinyinFrontend, default_frontend
+from .lexicon_trie import LexiconTrie
+from .lru_cache import LRUCache
+
+PUNCTUATION = "，。、？!,.?"
+
+class ConversionResult(NamedTuple):
+    """一句文本的方言转换结果
+
+    前三项与原先返回的 (声母列表, 韵母列表, 音素表示) 相同。
+    expansion_counts 为每个字（声母/韵母对）展开成的音素数，BERT特征按它逐字重复；
+    phoneme_lengths 为每个音素的长度，即清单中的 phoneme_length。
+    """
+    initials: List[str]
+    finals: List[str]
+    phoneme_text: str
+    phonemes: List[str]
+    expansion_counts: List[int]
+    phoneme_lengths: List[int]
+
+def _phoneme_length(phoneme):
+    """单个音素的长度：带'@'的音素不计'@'，标点计为长度+1"""
+    if '@' in phoneme:
+        return len(phoneme) - 1
+    elif phoneme in PUNCTUATION:
+        return len(phoneme) + 1
+    return len(phoneme)
+
+class DialectConverter:
+    """由规则表驱动的方言转换器
+
+    rules 为 DialectRules（可由JSON文件加载），初始化时编译为
+    (拼音声母, 韵母+声调) -> (方言声母, 方言韵母) 查找表。
+    分词与拼音查询由 frontend 完成，同一进程中的多个方言可以共用一个前端。
+
+    use_trie=True 时先用方言字典中多字词条的前缀树在原句上做正向最长匹配，
+    只对未匹配的片段调用 jieba；use_jieba=False 时未匹配的片段直接逐字处理
+    （不做分词，多音字只能按单字取音）。
+    """
+    def __init__(self, rules: DialectRules, custom_dict: Optional[Dict[str, List[str]]] = None,
+                 cache_size: Optional[int] = 100000, cache_path: Optional[str] = None,
+                 frontend: Optional[PinyinFrontend] = None, use_trie: bool = True, use_jieba: bool = True):
+        self.rules = rules
+        self.name = rules.name
 
-class XianDialectConverter:
-    def __init__(self, custom_dict: Optional[Dict[str, List[str]]] = None):
         # 基础读音字典
-        self.dialect_dict = BASE_DIALECT_DICT.copy()
-        
+        self.dialect_dict = dict(rules.lexicon)
+
         # 合并自定义字典
         if custom_dict:
             self.dialect_dict.update(custom_dict)
-        
+
+        # 多字词条必须逐字给出读音，否则BERT特征的逐字展开会错位，格式不对的词条跳过
+        for word in [w for w in self.dialect_dict if len(w) > 1]:
+            if not self._is_valid_word_item(word, self.dialect_dict[word]):
+                print(f"跳过方言字典词条 {word}: 多字词条应为 {len(word)} 个 [声母, 韵母] 或 [韵母]")
+                del self.dialect_dict[word]
+
         # 声母、韵母和声调对应规则
-        self.initial_rules = INITIAL_RULES
-        self.final_rules = FINAL_RULES
-        self.tone_rules = TONE_RULES
-        
-        self.cache = {}
+        self.initial_rules = rules.initials
+        self.final_rules = rules.finals
+        self.tone_rules = rules.tones
+
+        # 上下文规则编译为 {(拼音声母, 不带调韵母): 结果}，按顺序只保留第一条匹配
+        self.initial_context = self._compile_context_rules(rules.initial_context_rules)
+        self.final_context = self._compile_context_rules(rules.final_context_rules)
+
+        # (拼音声母, 韵母+声调) -> (方言声母, 方言韵母) 查找表，只在初始化时构建一次
+        self.syllable_table = self._build_syllable_table()
+
+        self.frontend = frontend if frontend is not None else default_frontend()
+
+        # 多字词条的前缀树，字典中没有多字词条时不使用
+        self.use_jieba = use_jieba
+        self.lexicon_trie = None
+        if use_trie:
+            trie = LexiconTrie(self.dialect_dict)
+            self.lexicon_trie = trie if trie.max_len > 0 else None
+
+        # 转换结果的LRU缓存（cache_size=None 表示不限容量），可从 cache_path 预热
+        self.cache = LRUCache(cache_size)
+        self.cache_path = cache_path
+        if cache_path and os.path.exists(cache_path):
+            self.cache.load(cache_path, tag=self._rules_fingerprint(), decode=lambda v: ConversionResult(*v))
+
+    @staticmethod
+    def _compile_context_rules(context_rules):
+        compiled = {}
+        for rule in context_rules:
+            for c in rule["initials"]:
+                for v in rule["finals"]:
+                    compiled.setdefault((c, v), rule["to"])
+        return compiled
+
+    def _rules_fingerprint(self):
+        """规则、字典与前端（jieba词典、用户词典）的指纹，其中任何一项变化后旧的缓存快照自动失效"""
+        rules = self.rules.to_dict()
+        rules["lexicon"] = self.dialect_dict
+        options = [self.lexicon_trie is not None, self.use_jieba]
+        payload = json.dumps([ConversionResult._fields, rules, options, self.frontend.fingerprint()],
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def init_kwargs(self):
+        """重新构建同样配置的转换器所需的参数（规则、字典之外），例如在子进程中"""
+        return {
+            "cache_size": self.cache.maxsize,
+            "cache_path": self.cache_path,
+            "use_trie": self.lexicon_trie is not None,
+            "use_jieba": self.use_jieba,
+        }
+
+    def save_cache(self, path: Optional[str] = None):
+        """将转换缓存保存到磁盘，默认保存到初始化时的 cache_path"""
+        path = path or self.cache_path
+        if path:
+            self.cache.save(path, tag=self._rules_fingerprint())
+
+    @staticmethod
+    def _is_valid_word_item(word, item):
+        """多字词条的读音应为与字数相同的 [声母, 韵母] 或 [韵母] 列表"""
+        return (isinstance(item, (list, tuple)) and len(item) == len(word)
+                and all(isinstance(x, (list, tuple)) and 1 <= len(x) <= 2 for x in item))
 
     def _normalize_dict_item(self, item):
         """规范化字典条目为(声母,韵母)格式"""
@@ -30,76 +138,73 @@ class XianDialectConverter:
             return item[0], item[1]
         return "", ""
 
+    def _convert_syllable(self, c, v):
+        """按音系规则将一个普通话音节（声母, 带调韵母）转换为方言（声母, 带调韵母）"""
+        # 提取声调
+        if v and v[-1] in "12345":
+            tone = v[-1]
+            v_without_tone = v[:-1]
+        else:
+            tone = self.rules.default_tone  # 默认为轻声
+            v_without_tone = v
+
+        # 转换声母(上下文规则优先)
+        initial = self.initial_context.get((c, v_without_tone))
+        if initial is None:
+            initial = self.initial_rules.get(c, c)
+
+        # 转换韵母(上下文规则优先)
+        final = self.final_context.get((c, v_without_tone))
+        if final is None:
+            final = self.final_rules.get(v_without_tone, v_without_tone)
+
+        # 添加声调
+        if tone in self.tone_rules:
+            final += self.tone_rules[tone]
+
+        return initial, final
+
+    def _build_syllable_table(self):
+        """预先计算所有 (声母, 韵母+声调) 组合的转换结果"""
+        table = {}
+        for c in list(self.initial_rules) + ['']:
+            for v in self.final_rules:
+                for tone in ('',) + tuple(self.tone_rules):
+                    table[(c, v + tone)] = self._convert_syllable(c, v + tone)
+        return table
+
     def _apply_phonological_rules(self, orig_initials, orig_finals):
-        """应用音系规则转换普通话拼音到西安方言拼音"""
+        """应用音系规则转换普通话拼音到方言拼音"""
         trans_initials = []
         trans_finals = []
-        
+
         for c, v in zip(orig_initials, orig_finals):
-            initial, final = "", ""
-            
-            # 提取声调
-            if v and v[-1] in "12345":
-                tone = v[-1]
-                v_without_tone = v[:-1]
-            else:
-                tone = "5"  # 默认为轻声
-                v_without_tone = v
-            
-            # 转换声母
-            if c in ['y','w',''] and v_without_tone in ['e', 'ai', 'ei', 'ao', 'an', 'en', 'ang', 'ou']:
-                initial = 'ŋ'
-            elif c in self.initial_rules:
-                initial = self.initial_rules[c]
-            else:
-                initial = c
-            
-            # 转换韵母(特殊规则优先)
-            if c in ['z', 'c', 's'] and v_without_tone == 'i':
-                final = 'ɿ'
-            elif c in ['zh', 'ch', 'sh', 'r'] and v_without_tone == 'i':
-                final = 'ʅ'
-            elif c in ['j','q','x'] and v_without_tone == 'un':
-                final = 'yẽ'
-            elif c in ['j','q','x'] and v_without_tone == 'uan':
-                final = 'yã'
-            elif v_without_tone in self.final_rules:
-                final = self.final_rules[v_without_tone]
-            else:
-                final = v_without_tone
-                
-            # 添加声调
-            if tone in self.tone_rules:
-                final += self.tone_rules[tone]
-            
-            trans_initials.append(initial)
-            trans_finals.append(final)
-        
+            syllable = self.syllable_table.get((c, v))
+            if syllable is None:
+                # 表中没有的组合（如非汉字片段）直接按规则计算，不补入表中，避免查找表随输入无限增长
+                syllable = self._convert_syllable(c, v)
+            trans_initials.append(syllable[0])
+            trans_finals.append(syllable[1])
+
         return trans_initials, trans_finals
 
-    def convert(self, text: str) -> Tuple[List[str], List[str], str]:
-        """将文本转换为西安方言读音序列，返回(声母列表,韵母列表,音素表示)"""
-        if text in self.cache:
-            return self.cache[text]
-        
+    def _convert_words(self, words):
+        """将分词结果转换为方言读音序列，返回 ConversionResult"""
         result_initials = []
         result_finals = []
-        
-        # 分词处理
-        words = list(jieba.cut(text))
-        
+
         for word in words:
-            # 检查整词是否在dialect_dict中
-            if word in self.dialect_dict:
-                initial, final = self._normalize_dict_item(self.dialect_dict[word])
-                result_initials.append(initial)
-                result_finals.append(final)
+            # 检查整词是否在dialect_dict中（多字词条逐字给出读音）
+            if len(word) > 1 and word in self.dialect_dict:
+                for item in self.dialect_dict[word]:
+                    initial, final = self._normalize_dict_item(item)
+                    result_initials.append(initial)
+                    result_finals.append(final)
                 continue
-            
-            # 获取整个词的拼音序列
-            orig_initials = lazy_pinyin(word, neutral_tone_with_five=True, style=Style.INITIALS)
-            orig_finals = lazy_pinyin(word, neutral_tone_with_five=True, style=Style.FINALS_TONE3)
-            
+
+            # 获取整个词的拼音序列（同一词只查询一次，各方言共享）
+            orig_initials, orig_finals = self.frontend.word_pinyin(word)
+
             # 逐字处理
             for i, char in enumerate(word):
                 if char in self.dialect_dict:
@@ -107,7 +212,7 @@ class XianDialectConverter:
                     initial, final = self._normalize_dict_item(self.dialect_dict[char])
                     result_initials.append(initial)
                     result_finals.append(final)
-                elif char in "，。、？!,.?":  # 标点符号
+                elif char in PUNCTUATION:  # 标点符号
                     result_initials.append("")
                     result_finals.append(char)
                 else:
@@ -118,24 +223,110 @@ class XianDialectConverter:
                         )
                         result_initials.extend(char_initials)
                         result_finals.extend(char_finals)
-        
-        # 生成音素表示
+
+        # 生成音素表示，同时记录每个字展开的音素数和每个音素的长度
         text_phone = []
+        counts = []
         for _o in zip(result_initials, result_finals):
             if _o[0] != _o[1] and _o[0] != '':
-                _o = ['@'+i for i in _o]
-                text_phone.extend(_o)
+                text_phone.extend(['@'+i for i in _o])
+                counts.append(2)
             elif _o[0] != _o[1] and _o[0] == '':
-                if _o[1] not in "，。、？!,.?":
+                if _o[1] not in PUNCTUATION:
                     text_phone.append('@'+_o[1])
                 else:
                     text_phone.append(_o[1])
+                counts.append(1)
             else:
                 text_phone.extend(list(_o[0]))
+                counts.append(len(_o[0]))
+
+        return ConversionResult(
+            initials=result_initials,
+            finals=result_finals,
+            phoneme_text=" ".join(text_phone),
+            phonemes=text_phone,
+            expansion_counts=counts,
+            phoneme_lengths=[_phoneme_length(p) for p in text_phone],
+        )
+
+    def _split_lexicon(self, text):
+        """按多字词条切分，返回 [(片段, 是否为词条)]"""
+        if self.lexicon_trie is None:
+            return [(text, False)]
+        return list(self.lexicon_trie.split(text))
+
+    def _segment_many(self, texts):
+        """对多句文本分词：先做词条最长匹配，再对其余片段统一调用一次 jieba"""
+        splits = [self._split_lexicon(text) for text in texts]
+        gaps = [span for split in splits for span, matched in split if not matched]
+        if not self.use_jieba:
+            gap_words = iter([list(span) for span in gaps])
+        else:
+            # 含换行的片段不能参与换行拼接，单独分词
+            batched = [span for span in gaps if "\n" not in span and "\r" not in span]
+            batched_words = iter(self.frontend.segment_many(batched) if batched else [])
+            gap_words = iter([next(batched_words) if "\n" not in span and "\r" not in span
+                              else self.frontend.segment(span) for span in gaps])
+
+        segmented = []
+        for split in splits:
+            words = []
+            for span, matched in split:
+                if matched:
+                    words.append(span)
+                else:
+                    words.extend(next(gap_words))
+            segmented.append(words)
+        return segmented
+
+    def convert(self, text: str) -> ConversionResult:
+        """将文本转换为方言读音序列，返回 ConversionResult（声母、韵母、音素表示及展开信息）"""
+        result = self.cache.get(text)
+        if result is not None:
+            return result
+
+        # 分词处理
+        if self.lexicon_trie is None and self.use_jieba:
+            words = self.frontend.segment(text)
+        else:
+            words = self._segment_many([text])[0]
+        result = self._convert_words(words)
 
-        text_phone = " ".join(text_phone)
-        
         # 缓存结果
-        self.cache[text] = (result_initials, result_finals, text_phone)
-        return result_initials, result_finals, text_phone
+        self.cache[text] = result
+        return result
+
+    def convert_many(self, texts: List[str]) -> List[ConversionResult]:
+        """批量转换多句文本，返回与输入顺序一致的结果列表
+
+        未缓存的句子（词条匹配之外的片段）以换行拼接后只调用一次 jieba 分词
+        （结果与逐句分词相同），重复出现的词只查询一次拼音。
+        """
+        results = {}
+        pending = {}
+        for text in texts:
+            if text in results or text in pending:
+                # 同一批中重复的句子只转换一次，与缓存命中一样计入命中数
+                self.cache.hits += 1
+                continue
+            result = self.cache.get(text)
+            if result is not None:
+                results[text] = result
+            elif "\n" in text or "\r" in text:
+                results[text] = self.convert(text)
+            else:
+                pending[text] = None
+
+        if pending:
+            pending = list(pending)
+            for text, words in zip(pending, self._segment_many(pending)):
+                results[text] = self._convert_words(words)
+                self.cache[text] = results[text]
+
+        return [results[text] for text in texts]
 
+class XianDialectConverter(DialectConverter):
+    """西安方言转换器，规则定义在 phonetic_rules.py 中"""
+    def __init__(self, custom_dict: Optional[Dict[str, List[str]]] = None, **kwargs):
+        super().__init__(xian_rules(), custom_dict=custom_dict, **kwargs)
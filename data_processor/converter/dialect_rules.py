@@ -0,0 +1,82 @@
+import json
+
+from .phonetic_rules import (
+    INITIAL_RULES, FINAL_RULES, TONE_RULES, DEFAULT_TONE, INITIAL_CONTEXT_RULES, FINAL_CONTEXT_RULES,
+    BASE_DIALECT_DICT,
+)
+
+class DialectRules:
+    """一种方言的转换规则与读音字典
+
+    可以保存为 / 读取自JSON文件，格式为：
+        {
+            "name": "xian",
+            "initials": {拼音声母: 方言声母},
+            "finals": {拼音韵母: 方言韵母},
+            "tones": {拼音声调: 方言调值},
+            "default_tone": "5",
+            "initial_context_rules": [{"initials": [...], "finals": [...], "to": 方言声母}],
+            "final_context_rules": [{"initials": [...], "finals": [...], "to": 方言韵母}],
+            "lexicon": {字: [声母, 韵母] 或 [韵母], 多字词: [[声母, 韵母] 或 [韵母], ...]（每个字一项）}
+        }
+    上下文规则按 (拼音声母, 不带调韵母) 匹配，优先于 initials/finals 中的逐项对应，按顺序取第一条。
+    """
+    def __init__(self, name, initials, finals, tones, default_tone=DEFAULT_TONE, initial_context_rules=None,
+                 final_context_rules=None, lexicon=None):
+        self.name = name
+        self.initials = dict(initials)
+        self.finals = dict(finals)
+        self.tones = dict(tones)
+        self.default_tone = default_tone
+        self.initial_context_rules = list(initial_context_rules or [])
+        self.final_context_rules = list(final_context_rules or [])
+        self.lexicon = dict(lexicon or {})
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            name=data["name"],
+            initials=data["initials"],
+            finals=data["finals"],
+            tones=data["tones"],
+            default_tone=data.get("default_tone", DEFAULT_TONE),
+            initial_context_rules=data.get("initial_context_rules"),
+            final_context_rules=data.get("final_context_rules"),
+            lexicon=data.get("lexicon"),
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "initials": self.initials,
+            "finals": self.finals,
+            "tones": self.tones,
+            "default_tone": self.default_tone,
+            "initial_context_rules": self.initial_context_rules,
+            "final_context_rules": self.final_context_rules,
+            "lexicon": self.lexicon,
+        }
+
+    @classmethod
+    def load(cls, path):
+        """从JSON文件读取规则"""
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        """保存为JSON文件，可作为新方言规则的模板"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+def xian_rules():
+    """phonetic_rules.py 中定义的西安方言规则"""
+    return DialectRules(
+        name="xian",
+        initials=INITIAL_RULES,
+        finals=FINAL_RULES,
+        tones=TONE_RULES,
+        default_tone=DEFAULT_TONE,
+        initial_context_rules=INITIAL_CONTEXT_RULES,
+        final_context_rules=FINAL_CONTEXT_RULES,
+        lexicon=BASE_DIALECT_DICT,
+    )
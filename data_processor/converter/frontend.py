@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import time
+import hashlib
+
+import jieba
+import pypinyin
+from pypinyin import lazy_pinyin, Style
+from pypinyin.contrib.tone_convert import to_finals_tone3, to_initials
+
+from .lru_cache import LRUCache
+
+# pypinyin 的 errors 回调给没有拼音的片段（非汉字）加上的标记
+_NO_PINYIN_MARK = "\x00"
+
+def _mark_no_pinyin(chars):
+    return _NO_PINYIN_MARK + chars
+
+# 能在本地拆分的 TONE3 音节：字母加一位声调
+_TONE3_SYLLABLE = re.compile(r"[a-z]+[1-5]")
+
+class PinyinFrontend:
+    """分词与普通话拼音前端
+
+    与具体方言无关，可被同一进程中的多个方言转换器共用：jieba 词典只加载一次，
+    词 -> 拼音 的查询结果也在各方言之间共享。
+
+    每个前端使用自己的 jieba.Tokenizer，用户词典只加载进这个分词器，不会修改全局的
+    jieba.dt，也不会在多个前端之间累积。jieba 在第一次分词时才构建词典（或读取缓存），
+    cache_file 指定词典缓存文件的位置（默认在临时目录中），例如临时目录不可写或不保留时
+    指向持久的路径；user_dicts 为额外加载的用户词典。
+    warm_up=True 时在初始化时就完成这些加载，而不是推迟到第一句话。
+    """
+    def __init__(self, memo_size=200000, cache_file=None, user_dicts=(), warm_up=False):
+        self.config = self.make_config(memo_size, cache_file, user_dicts)
+        # 词 -> (声母列表, 带调韵母列表)
+        self.pinyin_memo = LRUCache(memo_size)
+        self.cache_file = cache_file
+        self.user_dicts = list(user_dicts)
+        self.warm_up_seconds = None
+        self._ready = False
+        self.tokenizer = jieba.Tokenizer()
+        if cache_file:
+            self.tokenizer.cache_file = os.path.abspath(cache_file)
+        if warm_up:
+            self.warm_up()
+
+    @staticmethod
+    def make_config(memo_size=200000, cache_file=None, user_dicts=()):
+        """与 __init__ 参数对应的配置（不含 warm_up），用于判断两个前端的配置是否相同"""
+        return {
+            "memo_size": memo_size,
+            "cache_file": os.path.abspath(cache_file) if cache_file else None,
+            "user_dicts": [os.path.abspath(path) for path in user_dicts],
+        }
+
+    def init_kwargs(self):
+        """在子进程中重新构建同样配置的前端所需的参数"""
+        return {
+            "memo_size": self.pinyin_memo.maxsize,
+            "cache_file": self.cache_file,
+            "user_dicts": self.user_dicts,
+            "warm_up": self._ready,
+        }
+
+    @staticmethod
+    def _file_identity(path):
+        """文件的路径、大小和修改时间"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return [path, stat.st_size, stat.st_mtime_ns]
+
+    def fingerprint(self):
+        """影响分词和拼音结果的配置的指纹：jieba主词典、用户词典以及 jieba/pypinyin 版本"""
+        dictionary = self.tokenizer.dictionary
+        payload = {
+            "jieba": getattr(jieba, "__version__", None),
+            "pypinyin": getattr(pypinyin, "__version__", None),
+            # dictionary 为 None 时使用 jieba 自带的词典，由版本确定
+            "dictionary": self._file_identity(dictionary) if dictionary else None,
+            "user_dicts": [self._file_identity(path) for path in self.user_dicts],
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def warm_up(self):
+        """加载 jieba 词典（有缓存文件时直接读取）、用户词典和 pypinyin 数据，返回耗时（秒）"""
+        if self._ready:
+            return 0.0
+        start = time.perf_counter()
+        self.tokenizer.initialize()
+        for path in self.user_dicts:
+            self.tokenizer.load_userdict(path)
+        self._lookup_pinyin("预热")
+        self._ready = True
+        self.warm_up_seconds = time.perf_counter() - start
+        return self.warm_up_seconds
+
+    def segment(self, text):
+        """对单句分词"""
+        if not self._ready and self.user_dicts:
+            self.warm_up()  # 用户词典必须在分词前加载
+        return list(self.tokenizer.cut(text))
+
+    def segment_many(self, texts):
+        """以换行拼接后只调用一次 jieba 分词，返回各句的分词结果（结果与逐句分词相同）
+
+        texts 中的句子不能包含换行符。
+        """
+        if not self._ready and self.user_dicts:
+            self.warm_up()
+        segmented = [[]]
+        for word in self.tokenizer.cut("\n".join(texts)):
+            if word == "\n":
+                segmented.append([])
+            else:
+                segmented[-1].append(word)
+        assert len(segmented) == len(texts)
+        return segmented
+
+    def _lookup_pinyin(self, word):
+        """一次 TONE3 查询得到整词拼音，再在本地拆分为声母和带调韵母
+
+        是否为拼音由 pypinyin 按输入字符判断（没有拼音的片段经 errors 回调标记），
+        不根据输出的形状猜测，"mp3"、"h5" 这类片段不会被拆成声母韵母。
+        """
+        orig_initials, orig_finals = [], []
+        for syllable in lazy_pinyin(word, neutral_tone_with_five=True, style=Style.TONE3, errors=_mark_no_pinyin):
+            if syllable.startswith(_NO_PINYIN_MARK):
+                # 非汉字片段原样保留（与分别查询 INITIALS/FINALS_TONE3 的结果一致）
+                raw = syllable[len(_NO_PINYIN_MARK):]
+                if raw not in word:
+                    # 没有读音数据的汉字会被 pypinyin 补上轻声"5"，与分别查询的结果不同
+                    return self._lookup_pinyin_separately(word)
+                orig_initials.append(raw)
+                orig_finals.append(raw)
+            else:
+                final = to_finals_tone3(syllable, neutral_tone_with_five=True)
+                if not final or not _TONE3_SYLLABLE.fullmatch(syllable):
+                    # 嗯(n2)、呣(m2)这类没有韵母的音节，本地拆分与分别查询的结果不同，
+                    # 整词改用原先的两次查询
+                    return self._lookup_pinyin_separately(word)
+                orig_initials.append(to_initials(syllable))
+                orig_finals.append(final)
+        return orig_initials, orig_finals
+
+    @staticmethod
+    def _lookup_pinyin_separately(word):
+        """分别查询 INITIALS 和 FINALS_TONE3（拆分前的做法）"""
+        orig_initials = lazy_pinyin(word, neutral_tone_with_five=True, style=Style.INITIALS)
+        orig_finals = lazy_pinyin(word, neutral_tone_with_five=True, style=Style.FINALS_TONE3)
+        return orig_initials, orig_finals
+
+    def word_pinyin(self, word):
+        """整词的 (声母列表, 带调韵母列表)，同一个词只查询一次"""
+        result = self.pinyin_memo.get(word)
+        if result is None:
+            result = self._lookup_pinyin(word)
+            self.pinyin_memo[word] = result
+        return result
+
+_default_frontend = None
+
+def default_frontend(**kwargs):
+    """进程内共享的默认前端，第一次调用时按 kwargs 创建
+
+    之后不带参数调用时返回已创建的前端；带参数调用时配置必须与第一次相同，否则抛出
+    ValueError，而不是悄悄忽略这些参数。warm_up=True 时确保前端已完成加载。
+    """
+    global _default_frontend
+    warm_up = kwargs.pop("warm_up", False)
+    if _default_frontend is None:
+        _default_frontend = PinyinFrontend(**kwargs)
+    elif kwargs and PinyinFrontend.make_config(**kwargs) != _default_frontend.config:
+        raise ValueError(f"默认前端已按 {_default_frontend.config} 创建，不能再以 {kwargs} 调用")
+    if warm_up:
+        _default_frontend.warm_up()
+    return _default_frontend
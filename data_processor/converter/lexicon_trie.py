@@ -0,0 +1,55 @@
+class LexiconTrie:
+    """方言字典中多字词条的前缀树，用于在原始句子上做正向最长匹配
+
+    树节点为 {字: 子节点} 的字典，词条结束的节点带有 END 键。
+    单字词条不放入树中，由转换器逐字查询字典处理。
+    """
+    END = None
+
+    def __init__(self, words=()):
+        self.root = {}
+        self.max_len = 0
+        for word in words:
+            if len(word) > 1:
+                self.add(word)
+
+    def add(self, word):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[self.END] = True
+        self.max_len = max(self.max_len, len(word))
+
+    def __len__(self):
+        count, stack = 0, [self.root]
+        while stack:
+            node = stack.pop()
+            count += self.END in node
+            stack.extend(child for key, child in node.items() if key is not self.END)
+        return count
+
+    def longest_match(self, text, start):
+        """返回从 start 开始的最长词条的结束位置，没有匹配时返回 start"""
+        node, end = self.root, start
+        for i in range(start, min(len(text), start + self.max_len)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if self.END in node:
+                end = i + 1
+        return end
+
+    def split(self, text):
+        """正向最长匹配，依次产出 (片段, 是否为词条)，未匹配的连续字符合并为一个片段"""
+        gap_start, i = 0, 0
+        while i < len(text):
+            end = self.longest_match(text, i) if text[i] in self.root else i
+            if end == i:
+                i += 1
+                continue
+            if gap_start < i:
+                yield text[gap_start:i], False
+            yield text[i:end], True
+            gap_start = i = end
+        if gap_start < len(text):
+            yield text[gap_start:], False
@@ -0,0 +1,77 @@
+import os
+import json
+from collections import OrderedDict
+
+class LRUCache:
+    """容量有限的LRU缓存
+
+    超出容量时淘汰最久未使用的条目，统计 get 的命中率，并可保存到磁盘、
+    在下次启动时恢复（预热）。键为字符串，值需可被JSON序列化。
+    """
+    VERSION = 1
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """读取并统计命中率，命中的条目移动到最近使用的位置"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def save(self, path, tag=None):
+        """按从旧到新的顺序保存到JSON文件，tag 用于在恢复时校验缓存是否仍然有效"""
+        snapshot = {"version": self.VERSION, "tag": tag, "items": list(self._data.items())}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path, tag=None, decode=None):
+        """从JSON文件恢复条目，tag 不一致时忽略该文件，返回恢复的条目数"""
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != self.VERSION or snapshot.get("tag") != tag:
+            return 0
+        for key, value in snapshot["items"]:
+            self[key] = decode(value) if decode is not None else value
+        return len(snapshot["items"])
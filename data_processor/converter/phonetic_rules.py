@@ -70,6 +70,20 @@ FINAL_RULES = {
     'iong': 'yŋ',
 }
 
+# 上下文相关的声母规则（优先于 INITIAL_RULES，按顺序匹配第一条）
+# 零声母的开口呼音节读 ŋ 声母，如"我""安""爱"
+INITIAL_CONTEXT_RULES = [
+    {"initials": ['y', 'w', ''], "finals": ['e', 'ai', 'ei', 'ao', 'an', 'en', 'ang', 'ou'], "to": 'ŋ'},
+]
+
+# 上下文相关的韵母规则（优先于 FINAL_RULES，按顺序匹配第一条）
+FINAL_CONTEXT_RULES = [
+    {"initials": ['z', 'c', 's'], "finals": ['i'], "to": 'ɿ'},
+    {"initials": ['zh', 'ch', 'sh', 'r'], "finals": ['i'], "to": 'ʅ'},
+    {"initials": ['j', 'q', 'x'], "finals": ['un'], "to": 'yẽ'},
+    {"initials": ['j', 'q', 'x'], "finals": ['uan'], "to": 'yã'},
+]
+
 # 声调转换规则
 TONE_RULES = {
     '1': ToneType.阴平.value,
@@ -79,6 +93,9 @@ TONE_RULES = {
     '5': ToneType.入声.value
 }
 
+# 拼音没有声调标记时使用的声调（轻声）
+DEFAULT_TONE = '5'
+
 # 基础方言字典
 BASE_DIALECT_DICT = {
     "白": ["p","ei˨˦"],
@@ -0,0 +1,42 @@
+from .dialect_converter import DialectConverter
+from .dialect_rules import DialectRules, xian_rules
+from .frontend import default_frontend
+
+class DialectRegistry:
+    """在同一进程中管理多种方言的转换器
+
+    所有转换器共用一个 PinyinFrontend，jieba 词典和拼音查询结果只需准备一次，
+    每种方言只额外编译自己的规则查找表。默认注册 phonetic_rules.py 中的西安方言（"xian"）。
+    """
+    def __init__(self, frontend=None, cache_size=100000):
+        self.frontend = frontend if frontend is not None else default_frontend()
+        self.cache_size = cache_size
+        self._converters = {}
+        self.register(xian_rules())
+
+    def register(self, rules, custom_dict=None, cache_path=None):
+        """注册一种方言，rules 为 DialectRules 或规则JSON文件路径，返回对应的转换器"""
+        if isinstance(rules, str):
+            rules = DialectRules.load(rules)
+        converter = DialectConverter(rules, custom_dict=custom_dict, cache_size=self.cache_size,
+                                     cache_path=cache_path, frontend=self.frontend)
+        self._converters[rules.name] = converter
+        return converter
+
+    def get(self, name):
+        try:
+            return self._converters[name]
+        except KeyError:
+            raise KeyError(f"Unknown dialect {name}, registered: {self.names()}")
+
+    def names(self):
+        return sorted(self._converters)
+
+    def __contains__(self, name):
+        return name in self._converters
+
+    def convert(self, name, text):
+        return self.get(name).convert(text)
+
+    def convert_many(self, name, texts):
+        return self.get(name).convert_many(texts)
@@ -1,7 +1,50 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import soundfile as sf
 from pydub import AudioSegment
 
-def get_audio_duration(filepath):
-    """获取音频文件时长（秒）"""
+# 可以直接从文件头读取帧数与采样率的格式
+HEADER_FORMATS = ('.wav', '.flac')
+
+def _decode_duration(filepath):
+    """完整解码音频计算时长（用于mp3等压缩格式）"""
     audio = AudioSegment.from_file(filepath)
     return len(audio) / 1000.0  # 转换为秒
 
+def get_audio_duration(filepath):
+    """获取音频文件时长（秒）
+
+    WAV/FLAC 只读取文件头，其他格式或文件头无法解析时退回到完整解码。
+    """
+    if os.path.splitext(filepath)[1].lower() in HEADER_FORMATS:
+        try:
+            info = sf.info(filepath)
+            return info.frames / info.samplerate
+        except RuntimeError:
+            pass
+    return _decode_duration(filepath)
+
+def _safe_duration(filepath):
+    try:
+        return get_audio_duration(filepath)
+    except Exception as e:
+        print(f"Error probing {filepath}: {e}")
+        return None
+
+def get_audio_durations(filepaths, num_workers=8, use_processes=False):
+    """批量获取音频时长，返回与输入顺序一致的列表，失败的文件对应 None
+
+    默认使用线程池（文件头读取以I/O为主）；文件数很多或包含需要完整解码的
+    格式时，use_processes=True 改用进程池，避免解析开销受GIL限制。
+    """
+    filepaths = list(filepaths)
+    if num_workers <= 1:
+        return [_safe_duration(p) for p in filepaths]
+    if use_processes:
+        # 按块分发任务，减少进程间通信次数
+        chunksize = max(1, min(1024, len(filepaths) // (num_workers * 4)))
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(_safe_duration, filepaths, chunksize=chunksize))
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(_safe_duration, filepaths))
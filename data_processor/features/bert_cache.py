@@ -0,0 +1,56 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+class BertFeatureCache:
+    """按内容哈希持久化缓存展开后的BERT特征
+
+    键为 (文本, 声母, 韵母, 每个字的音素数, 模型标识, 隐藏层下标) 的 SHA-1，缓存文件保存在
+    <cache_dir>/<键前两位>/<键>.npy。转录文本未变化的条目在重新生成清单时直接复用。
+    """
+    def __init__(self, cache_dir, model_id, layer):
+        self.cache_dir = cache_dir
+        self.model_id = model_id
+        self.layer = layer
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, text, initials, finals, counts):
+        # 缓存的是展开后的特征，展开方式（counts）不同时行数不同，必须计入键中
+        payload = json.dumps([text, list(initials), list(finals), list(counts), self.model_id, self.layer],
+                             ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def get(self, key):
+        """命中时返回缓存的特征，否则返回 None"""
+        path = self._path(key)
+        if os.path.exists(path):
+            try:
+                array = np.load(path)
+                self.hits += 1
+                return array
+            except (OSError, ValueError):
+                pass  # 损坏的缓存文件按未命中处理，稍后覆盖
+        self.misses += 1
+        return None
+
+    def put(self, key, array):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
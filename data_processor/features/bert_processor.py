@@ -1,50 +1,267 @@
 import os
+import hashlib
 import torch
 import numpy as np
-from transformers import AutoTokenizer, AutoModelForMaskedLM
+from transformers import AutoConfig, AutoModel, AutoTokenizer, AutoModelForMaskedLM
+
+from .bert_cache import BertFeatureCache
+from .feature_store import NpyFeatureWriter
+
+# 可选的推理后端：torch(fp32)、int8(动态量化，CPU)、onnx(ONNX Runtime，CPU)
+BACKENDS = ('torch', 'int8', 'onnx')
+
+class _HiddenLayer(torch.nn.Module):
+    """按位置参数调用并只返回目标层隐藏状态的包装模块，用于ONNX导出"""
+    def __init__(self, extractor):
+        super().__init__()
+        self.model = extractor.model
+        self.input_names = extractor.input_names
+        self.layer = extractor.layer
+        self.truncate = extractor.truncate
+
+    def forward(self, *inputs):
+        kwargs = dict(zip(self.input_names, inputs))
+        if self.truncate:
+            return self.model(**kwargs).last_hidden_state
+        return self.model(**kwargs, output_hidden_states=True)['hidden_states'][self.layer]
 
 class BertFeatureExtractor:
-    def __init__(self, model_path, device='cuda:0'):
+    def __init__(self, model_path, device='cuda:0', max_tokens=8192, layer=-3, truncate=True,
+                 backend='torch', onnx_path=None, writer=None, cache_dir=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown BERT backend {backend}, expected one of {BACKENDS}")
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModelForMaskedLM.from_pretrained(model_path)
+        self.input_names = list(self.tokenizer.model_input_names)
+        # 使用的隐藏层下标，与 hidden_states 的下标含义一致（-3 即倒数第三层）
+        self.layer = layer
+        # 截断模式只加载基础编码器并运行到目标层，跳过其后的编码层与MLM词表投影
+        self.truncate = truncate
+        self.backend = backend
+        self.model = self._load_model(model_path)
+        if backend != 'torch' and device != 'cpu':
+            print(f"BERT backend {backend} only runs on CPU, ignoring device {device}")
+            device = 'cpu'
         self.device = device
         self.model.to(device)
-        
-    def extract_features(self, text, initials, finals, output_path):
-        """提取BERT特征并保存"""
+        self.model.eval()
+
+        self.session = None
+        if backend == 'int8':
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == 'onnx':
+            if onnx_path is None:
+                onnx_path = os.path.join(model_path, f"feature_extractor_layer{layer}.onnx")
+            self.session = self._load_onnx(onnx_path)
+        # 每个批次的token预算（批大小 x 填充后的最大长度）
+        self.max_tokens = max_tokens
+        # 特征写入器：默认每条语音一个.npy，也可以是 ShardedFeatureWriter
+        self.writer = writer if writer is not None else NpyFeatureWriter()
+        # 内容哈希缓存，模型标识包含后端（量化后的特征与fp32不同）
+        self.model_id = f"{self.model_fingerprint(model_path)}:{backend}" if cache_dir else None
+        self.cache = BertFeatureCache(cache_dir, self.model_id, layer) if cache_dir else None
+
+    @staticmethod
+    def model_fingerprint(model_path):
+        """模型的内容哈希：本地目录中除导出的ONNX文件外所有文件（配置、权重、词表）的 SHA-1
+
+        不是本地目录时（例如模型名称）使用名称本身。
+        """
+        if not os.path.isdir(model_path):
+            return model_path
+        sha1 = hashlib.sha1()
+        for root, dirs, files in os.walk(model_path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".onnx"):
+                    continue
+                path = os.path.join(root, name)
+                sha1.update(os.path.relpath(path, model_path).encode("utf-8"))
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        sha1.update(block)
+        return sha1.hexdigest()
+
+    def _load_model(self, model_path):
+        if not self.truncate:
+            return AutoModelForMaskedLM.from_pretrained(model_path)
+        config = AutoConfig.from_pretrained(model_path)
+        # hidden_states 共 num_hidden_layers+1 项（第0项为embedding输出）
+        num_layers = self.layer if self.layer >= 0 else config.num_hidden_layers + 1 + self.layer
+        if not 0 <= num_layers <= config.num_hidden_layers:
+            raise ValueError(f"Invalid hidden layer index {self.layer} for {config.num_hidden_layers} layers")
+        config.num_hidden_layers = num_layers
+        return AutoModel.from_pretrained(model_path, config=config, add_pooling_layer=False)
+
+    def _load_onnx(self, onnx_path):
+        """导出（若不存在）并加载ONNX模型"""
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime is required for --bert_backend onnx, install it with `pip install onnxruntime`")
+
+        if not os.path.exists(onnx_path):
+            inputs = self.tokenizer("西安方言", return_tensors='pt')
+            dynamic_axes = {name: {0: 'batch', 1: 'time'} for name in self.input_names}
+            dynamic_axes['hidden'] = {0: 'batch', 1: 'time'}
+            with torch.no_grad():
+                torch.onnx.export(
+                    _HiddenLayer(self),
+                    tuple(inputs[name] for name in self.input_names),
+                    onnx_path,
+                    input_names=self.input_names,
+                    output_names=['hidden'],
+                    dynamic_axes=dynamic_axes,
+                    opset_version=14,
+                )
+            print(f"ONNX模型已导出到 {onnx_path}")
+        return ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+
+    def _forward(self, inputs):
+        """返回目标层的隐藏状态，形状为 (B, T, D)"""
+        if self.session is not None:
+            feeds = {name: inputs[name].cpu().numpy() for name in self.input_names}
+            return torch.from_numpy(self.session.run(None, feeds)[0])
+        if self.truncate:
+            return self.model(**inputs).last_hidden_state
+        res = self.model(**inputs, output_hidden_states=True)
+        return res['hidden_states'][self.layer]
+
+    def encode(self, text):
+        """返回单句逐token的目标层特征 (T, D)，不做音素展开"""
         with torch.no_grad():
             inputs = self.tokenizer(text, return_tensors='pt')
             for i in inputs:
                 inputs[i] = inputs[i].to(self.device)
-            res = self.model(**inputs, output_hidden_states=True)
-            res = torch.cat(res['hidden_states'][-3:-2], -1)[0].cpu().numpy()
-            
-        _vecs = []
-        _text = []
-        _chars = []
-        for _o in zip(zip(initials, finals), text, res[1:-1]):
-            _o, _c, _vec = _o
-            if _o[0] != _o[1] and _o[0] != '':
-                _text.extend(['@'+i for i in _o])
-                _chars.extend([_c]*2)
-                _vecs.extend([_vec]*2)
-            elif _o[0] != _o[1] and _o[0] == '':
-                _text.append('@'+_o[1])
-                _chars.append(_c)
-                _vecs.append(_vec)
+            return self._forward(inputs)[0].float().cpu().numpy()
+
+    @staticmethod
+    def expansion_counts(initials, finals):
+        """每个字展开成的音素数，与 ConversionResult.expansion_counts 一致"""
+        counts = []
+        for _o in zip(initials, finals):
+            if _o[0] != _o[1]:
+                counts.append(2 if _o[0] != '' else 1)
             else:
-                _text.extend(list(_o[0]))  
-                _chars.extend([_c]*len(_o[0]))
-                _vecs.extend([_vec]*len(_o[0]))
-        
-        try:
-            assert len(_text) == len(_chars)
-            assert len(_vecs) == len(_text)
-        except:
-            print(f"Error in {output_path}")
-            return False
-            
-        _vecs = np.stack([res[0]] + _vecs + [res[-1]])
-        np.save(output_path, _vecs)
+                counts.append(len(_o[0]))
+        return counts
+
+    def _expand(self, text, counts, res):
+        """将逐字的BERT特征按每个字的音素数重复展开，首尾保留[CLS]/[SEP]"""
+        n = min(len(counts), len(text), res.shape[0] - 2)
+        _vecs = np.repeat(res[1:n + 1], counts[:n], axis=0)
+        return np.concatenate([res[:1], _vecs, res[-1:]])
+
+    def extract_features(self, text, initials, finals, output_path, counts=None):
+        """提取BERT特征并保存，counts 为每个字的音素数（缺省时由声母韵母计算）"""
+        if counts is None:
+            counts = self.expansion_counts(initials, finals)
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(text, initials, finals, counts)
+            _vecs = self.cache.get(key)
+            if _vecs is not None:
+                self.writer.write(output_path, _vecs)
+                return True
+
+        res = self.encode(text)
+        _vecs = self._expand(text, counts, res)
+        self.writer.write(output_path, _vecs)
+        if key is not None:
+            self.cache.put(key, _vecs)
         return True
 
+    def _make_batches(self, lengths):
+        """按长度排序后，在token预算内划分动态批次，返回下标列表"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        batches, cur = [], []
+        for i in order:
+            # 已排序，当前样本即为批内最长
+            if cur and (len(cur) + 1) * lengths[i] > self.max_tokens:
+                batches.append(cur)
+                cur = []
+            cur.append(i)
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def extract_batch(self, texts, initials, finals, paths, counts=None):
+        """批量提取BERT特征并保存，返回与输入顺序一致的成功标志列表
+
+        句子按token长度排序并在 max_tokens 预算内动态组批，每个批次只做一次
+        带填充的前向计算，再按各自的有效长度切回逐句特征并展开到音素。
+        启用缓存时，命中的句子直接写出缓存特征，不再参与计算。
+        counts 为各句每个字的音素数（ConversionResult.expansion_counts），缺省时由声母韵母计算。
+        """
+        success = [False] * len(texts)
+        if counts is None:
+            counts = [self.expansion_counts(initials[i], finals[i]) for i in range(len(texts))]
+        keys = [None] * len(texts)
+        todo = list(range(len(texts)))
+        if self.cache is not None:
+            todo = []
+            for i in range(len(texts)):
+                keys[i] = self.cache.key(texts[i], initials[i], finals[i], counts[i])
+                _vecs = self.cache.get(keys[i])
+                if _vecs is None:
+                    todo.append(i)
+                    continue
+                self.writer.write(paths[i], _vecs)
+                success[i] = True
+        if not todo:
+            return success
+
+        encodings = self.tokenizer([texts[i] for i in todo])
+        lengths = [len(ids) for ids in encodings['input_ids']]
+        names = list(encodings.keys())
+
+        for batch in self._make_batches(lengths):
+            features = [{k: encodings[k][j] for k in names} for j in batch]
+            try:
+                with torch.no_grad():
+                    inputs = self.tokenizer.pad(features, return_tensors='pt')
+                    for k in inputs:
+                        inputs[k] = inputs[k].to(self.device)
+                    res = self._forward(inputs).float().cpu().numpy()
+            except Exception as e:
+                # 例如显存不足：逐句重试这一批，仍然失败的句子保持 success=False
+                print(f"Error extracting BERT features for a batch of {len(batch)}: {e}, retrying one by one")
+                for j in batch:
+                    i = todo[j]
+                    try:
+                        success[i] = self.extract_features(texts[i], initials[i], finals[i], paths[i], counts[i])
+                    except Exception as e:
+                        print(f"Error extracting BERT features for {paths[i]}: {e}")
+                continue
+
+            for row, j in enumerate(batch):
+                i = todo[j]
+                _vecs = self._expand(texts[i], counts[i], res[row, :lengths[j]])
+                self.writer.write(paths[i], _vecs)
+                if keys[i] is not None:
+                    self.cache.put(keys[i], _vecs)
+                success[i] = True
+        return success
+
+def compare_features(reference, candidate, texts):
+    """比较两个特征提取器在同一批句子上的输出差异（例如fp32与int8/onnx）
+
+    返回逐元素最大/平均绝对误差以及逐token余弦相似度的最小/平均值。
+    """
+    max_abs, abs_sum, count = 0.0, 0.0, 0
+    cosines = []
+    for text in texts:
+        ref = reference.encode(text)
+        cand = candidate.encode(text)
+        diff = np.abs(ref - cand)
+        max_abs = max(max_abs, float(diff.max()))
+        abs_sum += float(diff.sum())
+        count += diff.size
+        norm = np.linalg.norm(ref, axis=-1) * np.linalg.norm(cand, axis=-1)
+        cosines.append((ref * cand).sum(-1) / np.maximum(norm, 1e-12))
+    cosines = np.concatenate(cosines)
+    return {
+        "max_abs_diff": max_abs,
+        "mean_abs_diff": abs_sum / max(count, 1),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+    }
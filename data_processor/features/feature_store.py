@@ -0,0 +1,95 @@
+import os
+import json
+import numpy as np
+
+# 分片特征库的索引文件名，NeMo 侧 TTSDataset 通过该文件识别分片格式
+INDEX_FILE = "index.json"
+
+def feature_key(path):
+    """由特征/音频路径得到特征库中的键（音频文件名去掉扩展名），与 TTSDataset 中一致"""
+    return os.path.basename(path).split(".")[0]
+
+class NpyFeatureWriter:
+    """每条语音保存一个 .npy 文件（原有格式）"""
+    def write(self, path, array):
+        np.save(path, array)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class ShardedFeatureWriter:
+    """分片特征库写入器
+
+    目录结构：
+        index.json        {"version", "dtype", "row_shape", "shards", "items": {键: [分片号, 起始行, 行数]}}
+        shard_00000.bin   按行连续存放的原始数组（默认fp16），可直接 np.memmap
+    每条特征的第0维为可变长度维（BERT特征为 T x 1024）。
+    目录中已有索引时在其基础上追加，新数据总是写入新的分片。
+    """
+    def __init__(self, output_dir, dtype="float16", shard_bytes=1 << 30):
+        self.output_dir = output_dir
+        self.dtype = np.dtype(dtype)
+        self.shard_bytes = shard_bytes
+        os.makedirs(output_dir, exist_ok=True)
+
+        index_path = os.path.join(output_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+            if np.dtype(self.index["dtype"]) != self.dtype:
+                raise ValueError(f"Feature store {output_dir} uses dtype {self.index['dtype']}, not {self.dtype}")
+        else:
+            self.index = {"version": 1, "dtype": self.dtype.name, "row_shape": None, "shards": [], "items": {}}
+
+        self._file = None
+        self._shard_rows = 0
+        self._shard_size = 0
+
+    def _open_shard(self):
+        self._close_shard()
+        name = f"shard_{len(self.index['shards']):05d}.bin"
+        self.index["shards"].append(name)
+        self._file = open(os.path.join(self.output_dir, name), "wb")
+        self._shard_rows = 0
+        self._shard_size = 0
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def write(self, path, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        row_shape = list(array.shape[1:])
+        if self.index["row_shape"] is None:
+            self.index["row_shape"] = row_shape
+        elif self.index["row_shape"] != row_shape:
+            raise ValueError(f"Expected rows of shape {self.index['row_shape']}, got {row_shape} for {path}")
+
+        if self._file is None or (self._shard_size > 0 and self._shard_size + array.nbytes > self.shard_bytes):
+            self._open_shard()
+        self._file.write(array.tobytes())
+        shard_id = len(self.index["shards"]) - 1
+        self.index["items"][feature_key(path)] = [shard_id, self._shard_rows, array.shape[0]]
+        self._shard_rows += array.shape[0]
+        self._shard_size += array.nbytes
+
+    def flush(self):
+        """落盘当前分片并原子地更新索引"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        index_path = os.path.join(self.output_dir, INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def close(self):
+        self.flush()
+        self._close_shard()
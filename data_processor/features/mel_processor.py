@@ -0,0 +1,137 @@
+import os
+from multiprocessing import Pool
+
+import librosa
+import numpy as np
+import soundfile as sf
+import torch
+import torch.nn.functional as F
+from tqdm import tqdm
+
+# 与 TTSDataset 中 WINDOW_FN_SUPPORTED 一致
+WINDOW_FN = {
+    'hann': torch.hann_window,
+    'hamming': torch.hamming_window,
+    'blackman': torch.blackman_window,
+    'bartlett': torch.bartlett_window,
+    'none': None,
+}
+
+# 与 TTSDataset.get_spec 中的 EPSILON 一致
+EPSILON = 1e-9
+
+def load_audio(path, sample_rate):
+    """读取音频为单声道float32，采样率不一致时重采样"""
+    audio, sr = sf.read(path, dtype='float32')
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if sr != sample_rate:
+        audio = librosa.resample(audio, orig_sr=sr, target_sr=sample_rate)
+    return audio
+
+def _load_job(job):
+    path, sample_rate = job
+    try:
+        return load_audio(path, sample_rate), None
+    except Exception as e:
+        return None, str(e)
+
+class MelSpectrogramGenerator:
+    """批量计算对数梅尔频谱，参数与 TTSDataset.get_log_mel 相同
+
+    TTSDataset 对单条音频调用 torch.stft(center=True)。这里先对每条音频单独做
+    n_fft//2 的反射填充，再在批内右侧补零对齐，用 center=False 一次完成整批STFT，
+    每条结果截取前 1 + len // hop 帧，与逐条计算的结果一致。
+    """
+    def __init__(self, sample_rate=22050, n_fft=1024, win_length=None, hop_length=None, n_mels=80,
+                 lowfreq=0, highfreq=None, window='hann', device='cpu'):
+        if window not in WINDOW_FN:
+            raise NotImplementedError(f"Unsupported window {window}, expected one of {list(WINDOW_FN)}")
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.win_length = win_length or n_fft
+        self.hop_len = hop_length or n_fft // 4
+        self.device = device
+        window_fn = WINDOW_FN[window]
+        self.window = window_fn(self.win_length, periodic=False).to(device) if window_fn else None
+        self.fb = torch.tensor(
+            librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels, fmin=lowfreq, fmax=highfreq),
+            dtype=torch.float,
+            device=device,
+        )
+
+    def num_frames(self, num_samples):
+        return 1 + num_samples // self.hop_len
+
+    def compute(self, audios):
+        """计算一批音频的对数梅尔频谱，返回 (n_mels, T) 的numpy数组列表"""
+        pad = self.n_fft // 2
+        padded = []
+        for audio in audios:
+            x = torch.as_tensor(audio, dtype=torch.float, device=self.device)
+            # 与 center=True 相同的反射填充，音频过短时退回到补零
+            mode = 'reflect' if x.shape[0] > pad else 'constant'
+            padded.append(F.pad(x[None, None], (pad, pad), mode=mode)[0, 0])
+        max_len = max(x.shape[0] for x in padded)
+        batch = torch.stack([F.pad(x, (0, max_len - x.shape[0])) for x in padded])
+
+        with torch.no_grad():
+            spec = torch.stft(
+                batch,
+                n_fft=self.n_fft,
+                hop_length=self.hop_len,
+                win_length=self.win_length,
+                window=self.window,
+                center=False,
+                return_complex=True,
+            )
+            spec = torch.view_as_real(spec)
+            spec = torch.sqrt(spec.pow(2).sum(-1) + EPSILON)
+            mel = torch.matmul(self.fb, spec)
+            log_mel = torch.log(torch.clamp(mel, min=torch.finfo(mel.dtype).tiny)).cpu().numpy()
+
+        return [log_mel[i, :, :self.num_frames(len(audio))] for i, audio in enumerate(audios)]
+
+    def generate(self, audio_paths, mel_paths, num_workers=8, max_batch_samples=22050 * 300):
+        """为 audio_paths 生成梅尔频谱并保存到对应的 mel_paths，返回成功的条数
+
+        音频由进程池读取，按文件大小排序后组批，每批补零后的总采样点数不超过
+        max_batch_samples。
+        """
+        order = sorted(range(len(audio_paths)), key=lambda i: os.path.getsize(audio_paths[i]))
+        jobs = [(audio_paths[i], self.sample_rate) for i in order]
+
+        done = 0
+        batch, batch_paths = [], []
+        batch_max = 0
+
+        def flush():
+            nonlocal done, batch_max
+            for mel, mel_path in zip(self.compute(batch), batch_paths):
+                np.save(mel_path, mel)
+                done += 1
+            batch.clear()
+            batch_paths.clear()
+            batch_max = 0
+
+        pool = Pool(num_workers) if num_workers > 1 else None
+        results = pool.imap(_load_job, jobs, chunksize=16) if pool is not None else map(_load_job, jobs)
+        try:
+            for i, (audio, error) in zip(order, tqdm(results, total=len(jobs), desc="生成梅尔频谱")):
+                if error is not None:
+                    print(f"Error loading {audio_paths[i]}: {error}")
+                    continue
+                longest = max(batch_max, len(audio))
+                if batch and (len(batch) + 1) * longest > max_batch_samples:
+                    flush()
+                    longest = len(audio)
+                batch.append(audio)
+                batch_max = longest
+                batch_paths.append(mel_paths[i])
+            if batch:
+                flush()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return done
@@ -1,73 +1,241 @@
 #!/usr/bin/env python3
 import os
 import argparse
+from itertools import chain, islice
+from multiprocessing import Pool
 from tqdm import tqdm
 
-from converter.dialect_converter import XianDialectConverter
+from converter.dialect_converter import DialectConverter, XianDialectConverter
+from converter.dialect_rules import DialectRules
+from converter.frontend import default_frontend
 from features.audio_processor import get_audio_duration
-from features.bert_processor import BertFeatureExtractor
-from utils.io_utils import load_transcript_dict, save_json, ensure_dir
-
-def process_audio_files(trans_dict, converter, bert_extractor=None, bert_path=None):
-    """处理音频文件并生成 JSON 数据"""
-    output_data = []
-    
-    for filepath, text in tqdm(trans_dict.items()):
+from features.bert_processor import BACKENDS, BertFeatureExtractor, compare_features
+from features.feature_store import ShardedFeatureWriter
+from utils.io_utils import iter_transcripts, parse_shard, load_done_paths, JsonlWriter, ensure_dir
+
+# 子进程内的方言转换器，由 _init_worker 创建
+_worker_converter = None
+
+def analyze_item(filepath, conversion):
+    """CPU阶段：时长探测，conversion 为方言转换结果（ConversionResult，已包含音素长度）"""
+    duration = get_audio_duration(filepath)
+    return duration, conversion
+
+def analyze_items(items, converter):
+    """对一组条目执行CPU阶段，方言转换通过 convert_many 批量分词"""
+    try:
+        conversions = converter.convert_many([text for _, text in items])
+    except Exception:
+        conversions = [None] * len(items)  # 出错的句子在下面逐条转换时单独报告
+    results = []
+    for (filepath, text), conversion in zip(items, conversions):
         try:
-            duration = get_audio_duration(filepath)
-            
-            # 转换为方言音素
-            result_initials, result_finals, phoneme_text = converter.convert(text)
-            
-            # 提取BERT特征（如果需要）
-            if bert_extractor and bert_path:
-                name = os.path.join(bert_path, f"{filepath.split('/')[-1].replace('.wav', '.npy')}")
-                bert_extractor.extract_features(text, result_initials, result_finals, name)
-            
-            # 计算音素长度
-            phoneme_length = []
-            for char in phoneme_text.split(" "):
-                if '@' in char:
-                    phoneme_length.append(len(char)-1)
-                elif char in "，。、？!,.?":  # 标点符号
-                    phoneme_length.append(len(char)+1)
-                else:
-                    phoneme_length.append(len(char))
-            
-            # 构造输出数据
-            cur_info = {
-                "audio_filepath": filepath,
-                "duration": duration,
-                "text": text,
-                "speaker": 0,
-                "normalized_text": phoneme_text,
-                "phoneme_length": phoneme_length
-            }
-            output_data.append(cur_info)
-            
+            if conversion is None:
+                conversion = converter.convert(text)
+            results.append((filepath, text, analyze_item(filepath, conversion), None))
         except Exception as e:
-            print(f"Error processing {filepath}: {e}")
-            continue
-            
-    return output_data
+            results.append((filepath, text, None, str(e)))
+    return results
+
+def _init_worker(rules, custom_dict, converter_kwargs, frontend_kwargs):
+    global _worker_converter
+    # 以 fork 方式启动时子进程直接继承主进程中已加载的 jieba 词典，不会重复加载
+    frontend = default_frontend(**frontend_kwargs)
+    # 子进程只读取缓存快照用于预热，快照由主进程统一保存
+    _worker_converter = DialectConverter(rules, custom_dict, frontend=frontend, **converter_kwargs)
+
+def _analyze_in_worker(chunk):
+    """返回这一组条目的结果，以及处理期间子进程转换缓存的命中、未命中数"""
+    cache = _worker_converter.cache
+    hits, misses = cache.hits, cache.misses
+    results = analyze_items(chunk, _worker_converter)
+    return results, cache.hits - hits, cache.misses - misses
+
+def _collect_worker_results(results, cache):
+    """依次产出子进程的结果，并把子进程的缓存命中统计累加到主进程的缓存上"""
+    for chunk_results, hits, misses in results:
+        cache.hits += hits
+        cache.misses += misses
+        yield chunk_results
+
+def _analyze_serial(chunks, converter):
+    for chunk in chunks:
+        yield analyze_items(chunk, converter)
+
+def _flush_bert(bert_extractor, pending):
+    """批量提取缓存的BERT特征任务，返回与 pending 顺序一致的成功标志列表
+
+    整批失败时逐条重试，仍然失败的条目标记为失败并报告音频路径。
+    """
+    if not pending:
+        return []
+    texts, conversions, paths = zip(*pending)
+    initials = [c.initials for c in conversions]
+    finals = [c.finals for c in conversions]
+    counts = [c.expansion_counts for c in conversions]
+    try:
+        success = bert_extractor.extract_batch(texts, initials, finals, paths, counts)
+    except Exception as e:
+        print(f"Error extracting BERT features for {len(pending)} files: {e}, retrying one by one")
+        success = []
+        for text, conversion, path in pending:
+            try:
+                success.append(bert_extractor.extract_features(text, conversion.initials, conversion.finals, path,
+                                                               conversion.expansion_counts))
+            except Exception as e:
+                print(f"Error extracting BERT features for {path}: {e}")
+                success.append(False)
+    pending.clear()
+    return success
+
+def _chunked(items, size):
+    """将可迭代对象按 size 条切分为列表，不一次性读入全部条目"""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def process_audio_files(items, writer, converter, bert_extractor=None, bert_path=None, workers=1,
+                        bert_batch_size=256):
+    """处理音频文件，逐条写出清单
+
+    items 为 (音频路径, 文本) 的可迭代对象，可以是 iter_transcripts 返回的生成器。
+
+    workers > 1 时，CPU阶段分发到进程池并行执行，BERT特征提取仍在主进程中
+    依次完成（单一GPU消费者），输出顺序与输入顺序一致。
+    BERT任务每累计 bert_batch_size 条送入 extract_batch 动态组批提取，
+    对应的清单条目在这一批特征写出之后才交给 writer。
+    """
+    bert_pending = []
+    bert_entries = []  # 等待BERT特征写出的清单条目
+    total = len(items) if hasattr(items, '__len__') else None
+    chunk_size = max(1, min(64, total // (workers * 4))) if total is not None else 64
+    chunks = _chunked(items, chunk_size)
+
+    pool = None
+    if workers > 1:
+        pool = Pool(workers, initializer=_init_worker,
+                    initargs=(converter.rules, converter.dialect_dict, converter.init_kwargs(),
+                              converter.frontend.init_kwargs()))
+        results = _collect_worker_results(pool.imap(_analyze_in_worker, chunks), converter.cache)
+    else:
+        results = _analyze_serial(chunks, converter)
+    results = chain.from_iterable(results)
+
+    def flush_bert():
+        # 只写出BERT特征提取成功的条目，失败的条目不进入清单
+        success = _flush_bert(bert_extractor, bert_pending)
+        for entry, ok in zip(bert_entries, success):
+            if ok:
+                writer.write(entry)
+            else:
+                print(f"Skipping {entry['audio_filepath']}: BERT feature extraction failed")
+        bert_entries.clear()
+
+    try:
+        for filepath, text, analysis, error in tqdm(results, total=total):
+            if error is not None:
+                print(f"Error processing {filepath}: {error}")
+                continue
+            try:
+                duration, conversion = analysis
+                if pool is not None:
+                    # 子进程的转换结果汇总到主进程缓存，便于保存快照
+                    converter.cache[text] = conversion
+
+                # 构造输出数据
+                cur_info = {
+                    "audio_filepath": filepath,
+                    "duration": duration,
+                    "text": text,
+                    "speaker": 0,
+                    "normalized_text": conversion.phoneme_text,
+                    "phoneme_length": conversion.phoneme_lengths
+                }
+
+                # 提取BERT特征（如果需要）
+                if bert_extractor and bert_path:
+                    name = os.path.join(bert_path, f"{filepath.split('/')[-1].replace('.wav', '.npy')}")
+                    bert_pending.append((text, conversion, name))
+                    bert_entries.append(cur_info)
+                    if len(bert_pending) >= bert_batch_size:
+                        flush_bert()
+                else:
+                    writer.write(cur_info)
+
+            except Exception as e:
+                print(f"Error processing {filepath}: {e}")
+                continue
+
+        if bert_extractor and bert_path:
+            flush_bert()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return writer.count
 
 def main():
     parser = argparse.ArgumentParser(description="西安方言处理工具")
-    parser.add_argument("text_path", help="转录文本路径")
+    parser.add_argument("text_path", nargs="+", help="转录文本路径，可以是多个文件或通配符")
     parser.add_argument("output_path", help="输出JSON路径")
     parser.add_argument("--bert_path", help="BERT特征输出路径")
     parser.add_argument("--bert_model", help="BERT模型路径")
     parser.add_argument("--device", default="cuda:0", help="设备 (例如 'cuda:0', 'cpu')")
     parser.add_argument("--generate_bert", action="store_true", help="是否生成BERT特征")
-    
+    parser.add_argument("--workers", type=int, default=1, help="CPU阶段并行进程数，默认为1（串行）")
+    parser.add_argument("--bert_batch_size", type=int, default=256, help="每次送入BERT批量提取的句子数")
+    parser.add_argument("--bert_full_model", action="store_true",
+                        help="加载完整的MLM模型并输出所有隐藏层（默认只运行到目标层）")
+    parser.add_argument("--bert_format", default="npy", choices=["npy", "sharded"],
+                        help="BERT特征保存格式：npy（每条语音一个文件）或 sharded（fp16分片库+索引）")
+    parser.add_argument("--bert_backend", default="torch", choices=BACKENDS,
+                        help="BERT推理后端：torch(fp32)、int8(CPU动态量化)、onnx(CPU ONNX Runtime)")
+    parser.add_argument("--bert_onnx_path", help="onnx后端的模型文件路径，不存在时自动导出，默认保存在BERT模型目录下")
+    parser.add_argument("--bert_parity_check", type=int, default=0,
+                        help="用前N条文本对比所选后端与fp32特征的数值偏差，默认为0（不检查）")
+    parser.add_argument("--bert_cache", help="BERT特征内容哈希缓存目录，文本未变化的条目直接复用缓存")
+    parser.add_argument("--shard", help="只处理第i个分片（共N个），格式为 i/N，按音频路径确定性划分")
+    parser.add_argument("--resume", action="store_true",
+                        help="断点续跑：跳过输出清单中已有的音频，在其末尾继续追加")
+    parser.add_argument("--sync_every", type=int, default=1000, help="每写出N条清单落盘一次（fsync），默认为1000")
+    parser.add_argument("--dialect_rules", help="方言规则JSON文件（格式见 converter/dialect_rules.py），默认使用西安方言规则")
+    parser.add_argument("--no_lexicon_match", action="store_true",
+                        help="不在分词前用方言字典的多字词条做最长匹配（只检查 jieba 切出的词）")
+    parser.add_argument("--no_jieba", action="store_true",
+                        help="不使用 jieba 分词：方言字典词条最长匹配之外的文字逐字转换")
+    parser.add_argument("--jieba_cache", help="jieba词典缓存文件的位置，默认在系统临时目录中；临时目录不可写或不保留时指定持久的路径")
+    parser.add_argument("--user_dict", action="append", default=[], help="jieba用户词典，可以指定多次")
+    parser.add_argument("--converter_cache", help="方言转换缓存快照路径，存在时用于预热，处理结束后更新")
+    parser.add_argument("--converter_cache_size", type=int, default=100000, help="方言转换LRU缓存容量（句数），默认为100000")
+    parser.add_argument("--bert_max_tokens", type=int, default=8192, help="BERT单个批次的token预算（批大小x填充长度）")
+
     args = parser.parse_args()
-    
-    # 加载转录字典
-    trans_dict = load_transcript_dict(args.text_path)
-    
-    # 初始化方言转换器
-    converter = XianDialectConverter()
-    
+
+    # 按需逐行读取转录文本
+    shard = parse_shard(args.shard) if args.shard else None
+    items = iter_transcripts(args.text_path, shard)
+
+    # 断点续跑时跳过已写入清单的音频
+    if args.resume:
+        done = load_done_paths(args.output_path)
+        items = ((k, v) for k, v in items if k not in done)
+        print(f"已完成 {len(done)} 条，跳过这些条目继续处理")
+
+    # 初始化方言转换器，在创建进程池之前加载分词与拼音数据
+    frontend = default_frontend(cache_file=args.jieba_cache, user_dicts=args.user_dict, warm_up=True)
+    print(f"分词与拼音数据加载耗时 {frontend.warm_up_seconds:.2f} 秒")
+    converter_kwargs = dict(frontend=frontend, cache_size=args.converter_cache_size,
+                            cache_path=args.converter_cache, use_trie=not args.no_lexicon_match,
+                            use_jieba=not args.no_jieba)
+    if args.dialect_rules:
+        converter = DialectConverter(DialectRules.load(args.dialect_rules), **converter_kwargs)
+    else:
+        converter = XianDialectConverter(**converter_kwargs)
+
     # 初始化BERT特征提取器（如果需要）
     bert_extractor = None
     if args.generate_bert:
@@ -75,18 +243,44 @@ def main():
             print("Error: --bert_model and --bert_path are required when --generate_bert is set")
             return
         ensure_dir(args.bert_path)
-        bert_extractor = BertFeatureExtractor(args.bert_model, args.device)
-    
-    # 处理音频文件
-    data = process_audio_files(trans_dict, converter, bert_extractor, args.bert_path)
-    
-    # 保存为JSON文件
-    save_json(data, args.output_path)
-    
-    print(f"处理完成。JSON已保存到 {args.output_path}")
+        feature_writer = ShardedFeatureWriter(args.bert_path) if args.bert_format == "sharded" else None
+        bert_extractor = BertFeatureExtractor(args.bert_model, args.device, max_tokens=args.bert_max_tokens,
+                                              truncate=not args.bert_full_model, backend=args.bert_backend,
+                                              onnx_path=args.bert_onnx_path, writer=feature_writer,
+                                              cache_dir=args.bert_cache)
+
+        if args.bert_parity_check > 0 and args.bert_backend != "torch":
+            reference = BertFeatureExtractor(args.bert_model, "cpu", truncate=not args.bert_full_model)
+            texts = [text for _, text in islice(iter_transcripts(args.text_path, shard), args.bert_parity_check)]
+            stats = compare_features(reference, bert_extractor, texts)
+            print(f"{args.bert_backend} 与 fp32 特征偏差（{len(texts)} 条文本）: "
+                  + ", ".join(f"{k}={v:.6f}" for k, v in stats.items()))
+            del reference
+
+    # 处理音频文件，清单落盘前先落盘BERT特征
+    on_sync = bert_extractor.writer.flush if bert_extractor is not None else None
+    writer = JsonlWriter(args.output_path, resume=args.resume, sync_every=args.sync_every, on_sync=on_sync)
+    try:
+        count = process_audio_files(items, writer, converter, bert_extractor, args.bert_path, args.workers,
+                                    args.bert_batch_size)
+    finally:
+        writer.close()
+
+    if args.converter_cache:
+        converter.save_cache()
+    # workers > 1 时为各子进程统计之和（每个子进程有各自的缓存）
+    stats = converter.cache.stats()
+    print(f"方言转换缓存命中 {stats['hits']} 条，未命中 {stats['misses']} 条（命中率 {stats['hit_rate']:.1%}）")
+
+    if bert_extractor is not None:
+        bert_extractor.writer.close()
+        if bert_extractor.cache is not None:
+            stats = bert_extractor.cache.stats()
+            print(f"BERT缓存命中 {stats['hits']} 条，未命中 {stats['misses']} 条（命中率 {stats['hit_rate']:.1%}）")
+
+    print(f"处理完成。本次写出 {count} 条，JSON已保存到 {args.output_path}")
     if args.generate_bert:
         print(f"BERT特征已保存到 {args.bert_path}")
 
 if __name__ == "__main__":
     main()
-
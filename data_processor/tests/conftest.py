@@ -0,0 +1,5 @@
+import os
+import sys
+
+# data_processor 中的脚本以所在目录为导入根目录（from converter.x import ...），测试同样如此
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
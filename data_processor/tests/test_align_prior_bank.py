@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("scipy")
+
+# NeMo 侧的对齐先验
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "codes", "NeMo"))
+tts_dataset_utils = pytest.importorskip("nemo.collections.tts.parts.utils.tts_dataset_utils")
+
+# (mel_len, text_len)：包含宽度为 1、刚好是取整倍数以及远大于建库尺寸的情况
+SIZES = [(1, 1), (1, 7), (24, 1), (37, 5), (50, 10), (123, 17), (401, 33), (999, 88)]
+
+def test_bank_matches_interpolator(tmp_path):
+    interpolator = tts_dataset_utils.BetaBinomialInterpolator()
+    # 只用一部分尺寸建库，其余尺寸在调用时临时计算
+    bank = tts_dataset_utils.AlignPriorBank().build(SIZES[::2])
+    bank.save(tmp_path / "bank.pt")
+    loaded = tts_dataset_utils.AlignPriorBank.load(tmp_path / "bank.pt")
+    assert loaded.offsets == bank.offsets
+
+    for w, h in SIZES:
+        expected = interpolator(w, h)
+        for prior_bank in (bank, loaded):
+            prior = prior_bank(w, h)
+            assert tuple(prior.shape) == (w, h)
+            np.testing.assert_allclose(prior.numpy(), expected, rtol=1e-4, atol=1e-6)
+    assert len(bank._extra) > 0
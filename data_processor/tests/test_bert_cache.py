@@ -0,0 +1,19 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from features.bert_cache import BertFeatureCache
+
+def test_key_depends_on_expansion_counts(tmp_path):
+    cache = BertFeatureCache(str(tmp_path), "model", -3)
+    key = cache.key("西安", ["x", ""], ["i", "an"], [2, 1])
+    cache.put(key, np.zeros((5, 4), dtype=np.float32))
+    # 同样的文本和声母韵母，在另一套方言规则下展开方式不同
+    assert cache.get(cache.key("西安", ["x", ""], ["i", "an"], [2, 2])) is None
+    assert cache.get(key).shape == (5, 4)
+
+def test_key_depends_on_model(tmp_path):
+    first = BertFeatureCache(str(tmp_path), "model-a", -3)
+    second = BertFeatureCache(str(tmp_path), "model-b", -3)
+    args = ("西安", ["x", ""], ["i", "an"], [2, 1])
+    assert first.key(*args) != second.key(*args)
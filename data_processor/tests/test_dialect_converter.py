@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("jieba")
+pytest.importorskip("pypinyin")
+
+from converter.dialect_converter import XianDialectConverter
+from converter.frontend import PinyinFrontend
+
+def test_multi_char_entry_has_one_reading_per_char():
+    converter = XianDialectConverter({"油泼面": [["j", "iou"], ["pʰ", "o"], ["mi", "ã"]]})
+    text = "吃油泼面好"
+    result = converter.convert(text)
+    # BERT特征按 expansion_counts 逐字展开，必须每个字一项
+    assert len(result.expansion_counts) == len(text)
+    assert result.initials[1:4] == ["j", "pʰ", "mi"]
+    assert converter.convert_many([text])[0] == result
+
+def test_multi_char_entry_with_single_reading_is_skipped():
+    converter = XianDialectConverter({"油泼面": ["j", "iou"]})
+    assert "油泼面" not in converter.dialect_dict
+    text = "吃油泼面好"
+    assert len(converter.convert(text).expansion_counts) == len(text)
+
+def test_unknown_syllables_do_not_grow_table():
+    converter = XianDialectConverter()
+    size = len(converter.syllable_table)
+    converter._apply_phonological_rules([f"id{i}" for i in range(1000)], [f"id{i}" for i in range(1000)])
+    assert len(converter.syllable_table) == size
+
+def test_cache_snapshot_is_invalidated_by_user_dict_change(tmp_path):
+    user_dict = tmp_path / "user.txt"
+    user_dict.write_text("油泼面 10\n", encoding="utf-8")
+    cache_path = str(tmp_path / "cache.json")
+
+    def make_converter():
+        frontend = PinyinFrontend(user_dicts=[str(user_dict)])
+        return XianDialectConverter(frontend=frontend, cache_path=cache_path, use_jieba=False)
+
+    converter = make_converter()
+    converter.convert("吃油泼面好")
+    converter.save_cache()
+    assert len(make_converter().cache) == 1
+
+    user_dict.write_text("油泼 10\n面 5\n", encoding="utf-8")
+    assert len(make_converter().cache) == 0
+
+def test_repeats_within_a_batch_count_as_hits():
+    converter = XianDialectConverter()
+    texts = ["西安好", "吃的", "西安好", "西安好", "吃的"]
+    results = converter.convert_many(texts)
+    assert results[0] == results[2] == results[3]
+    stats = converter.cache.stats()
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+
+def test_snapshot_is_discarded_when_rules_change(tmp_path):
+    cache_path = str(tmp_path / "cache.json")
+    converter = XianDialectConverter(cache_path=cache_path, use_jieba=False)
+    converter.convert("西安好")
+    converter.save_cache()
+    assert len(XianDialectConverter(cache_path=cache_path, use_jieba=False).cache) == 1
+    changed = XianDialectConverter({"好": ["x", "au˥˧"]}, cache_path=cache_path, use_jieba=False)
+    assert len(changed.cache) == 0
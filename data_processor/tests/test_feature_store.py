@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from features.feature_store import ShardedFeatureWriter
+
+# NeMo 侧的读取端
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "codes", "NeMo"))
+tts_dataset_utils = pytest.importorskip("nemo.collections.tts.parts.utils.tts_dataset_utils")
+
+def test_sharded_writer_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    features = {f"utt{i}": rng.standard_normal((3 + i, 4)).astype(np.float32) for i in range(5)}
+
+    # 分片很小，保证条目分布在多个分片中；中途 flush 模拟断点续跑
+    writer = ShardedFeatureWriter(str(tmp_path), shard_bytes=64)
+    for i, (key, array) in enumerate(features.items()):
+        writer.write(f"/data/wavs/{key}.npy", array)
+        if i == 2:
+            writer.flush()
+    writer.close()
+
+    assert tts_dataset_utils.PackedFeatureStore.exists(tmp_path)
+    store = tts_dataset_utils.PackedFeatureStore(tmp_path)
+    assert len(store) == len(features)
+    assert len(store.shards) > 1
+    for key, array in features.items():
+        assert key in store
+        assert store[key].dtype == np.float16
+        np.testing.assert_array_equal(store[key], array.astype(np.float16))
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("jieba")
+pytest.importorskip("pypinyin")
+
+from converter.frontend import PinyinFrontend
+
+@pytest.mark.parametrize("token", ["mp3", "h5", "abc1"])
+def test_alphanumeric_token_is_kept_raw(token):
+    initials, finals = PinyinFrontend()._lookup_pinyin(token)
+    assert initials == [token]
+    assert finals == [token]
+
+def test_chinese_is_split_into_initials_and_finals():
+    initials, finals = PinyinFrontend()._lookup_pinyin("好")
+    assert initials == ["h"]
+    assert finals == ["ao3"]
+
+def _lookup_separately(word):
+    from pypinyin import lazy_pinyin, Style
+    return (lazy_pinyin(word, neutral_tone_with_five=True, style=Style.INITIALS),
+            lazy_pinyin(word, neutral_tone_with_five=True, style=Style.FINALS_TONE3))
+
+def _require_real_pypinyin():
+    import pypinyin
+    if not hasattr(pypinyin, "__version__"):
+        pytest.skip("需要真实的 pypinyin 读音数据")
+
+def test_lookup_matches_separate_queries_for_all_chars():
+    # 拆分前分别查询 INITIALS/FINALS_TONE3，逐字比较整个基本汉字区
+    _require_real_pypinyin()
+    frontend = PinyinFrontend()
+    diff = [c for c in map(chr, range(0x4E00, 0x9FA6))
+            if frontend._lookup_pinyin(c) != _lookup_separately(c)]
+    assert diff == []
+
+@pytest.mark.parametrize("word", ["嗯好的", "呣", "mp3播放器", "兙", "西安h5", "女儿", "一会儿"])
+def test_lookup_matches_separate_queries_for_words(word):
+    _require_real_pypinyin()
+    assert PinyinFrontend()._lookup_pinyin(word) == _lookup_separately(word)
+
+def test_user_dicts_stay_in_their_own_frontend(tmp_path):
+    import jieba
+    user_dict = tmp_path / "user.txt"
+    user_dict.write_text("油泼面 100 n\n", encoding="utf-8")
+    with_dict = PinyinFrontend(user_dicts=[str(user_dict)])
+    plain = PinyinFrontend()
+    assert with_dict.tokenizer is not plain.tokenizer
+    assert with_dict.tokenizer is not jieba.dt
+    assert with_dict.fingerprint() != plain.fingerprint()
+
+def test_default_frontend_rejects_a_different_config(monkeypatch, tmp_path):
+    from converter import frontend as frontend_module
+    monkeypatch.setattr(frontend_module, "_default_frontend", None)
+    first = frontend_module.default_frontend(cache_file=str(tmp_path / "jieba.cache"))
+    assert frontend_module.default_frontend() is first
+    assert frontend_module.default_frontend(**first.init_kwargs()) is first
+    with pytest.raises(ValueError):
+        frontend_module.default_frontend(user_dicts=[str(tmp_path / "user.txt")])
@@ -0,0 +1,58 @@
+import json
+
+from utils.io_utils import JsonlWriter, iter_transcripts, load_done_paths, load_transcript_dict
+
+def test_duplicate_audio_path_keeps_last(tmp_path):
+    first = tmp_path / "a.txt"
+    second = tmp_path / "b.txt"
+    first.write_text("wav/1.wav 你好\nwav/2.wav 西安\nwav/1.wav 更正\n", encoding="utf-8")
+    second.write_text("wav/2.wav 又一次\nwav/3.wav 好的\n", encoding="utf-8")
+
+    # 与原先读入字典一致：在第一次出现的位置产出，最后一次出现的文本生效
+    items = list(iter_transcripts([str(first), str(second)]))
+    assert items == [("wav/1.wav", "更正"), ("wav/2.wav", "又一次"), ("wav/3.wav", "好的")]
+    expected = {}
+    for path in (first, second):
+        for line in path.read_text(encoding="utf-8").splitlines():
+            filename, text = line.split(" ", 1)
+            expected[filename] = text
+    assert items == list(expected.items())
+    assert load_transcript_dict(str(first)) == {"wav/1.wav": "更正", "wav/2.wav": "西安"}
+
+def test_sharded_transcripts_partition_the_input(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("".join(f"wav/{i}.wav 文本{i}\n" for i in range(50)), encoding="utf-8")
+    shards = [dict(iter_transcripts(str(path), (i, 3))) for i in range(3)]
+    assert sum(len(shard) for shard in shards) == 50
+    assert set().union(*shards) == {f"wav/{i}.wav" for i in range(50)}
+
+def test_resume_truncates_partial_last_line(tmp_path):
+    output = tmp_path / "manifest.json"
+    complete = [json.dumps({"audio_filepath": f"wav/{i}.wav"}) + "\n" for i in range(2)]
+    output.write_text("".join(complete) + '{"audio_filepath": "wav/2.w', encoding="utf-8")
+
+    assert load_done_paths(str(output)) == {"wav/0.wav", "wav/1.wav"}
+    assert output.read_text(encoding="utf-8") == "".join(complete)
+
+    writer = JsonlWriter(str(output), resume=True)
+    writer.write({"audio_filepath": "wav/2.wav"})
+    writer.close()
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["audio_filepath"] for line in lines] == ["wav/0.wav", "wav/1.wav", "wav/2.wav"]
+
+def test_features_are_synced_before_manifest_lines(tmp_path):
+    output = tmp_path / "manifest.json"
+    synced = []
+
+    def on_sync():
+        # 落盘特征时，这一批清单行还不能出现在文件中
+        synced.append(len(output.read_text(encoding="utf-8").splitlines()))
+
+    writer = JsonlWriter(str(output), sync_every=2, on_sync=on_sync)
+    for i in range(3):
+        writer.write({"audio_filepath": f"wav/{i}.wav"})
+    assert synced == [0]
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 2
+    writer.close()
+    assert synced == [0, 2]
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 3
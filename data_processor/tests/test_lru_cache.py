@@ -0,0 +1,30 @@
+from converter.lru_cache import LRUCache
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LRUCache(10)
+    cache["a"] = [1]
+    cache["b"] = [2]
+    cache.save(path, tag="rules-v1")
+
+    restored = LRUCache(10)
+    assert restored.load(path, tag="rules-v1") == 2
+    assert restored["b"] == [2]
+
+def test_snapshot_with_other_tag_is_discarded(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LRUCache(10)
+    cache["a"] = [1]
+    cache.save(path, tag="rules-v1")
+
+    restored = LRUCache(10)
+    assert restored.load(path, tag="rules-v2") == 0
+    assert len(restored) == 0
+
+def test_eviction_keeps_recently_used():
+    cache = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache.get("a")
+    cache["c"] = 3
+    assert "a" in cache and "c" in cache and "b" not in cache
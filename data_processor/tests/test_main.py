@@ -0,0 +1,27 @@
+import pytest
+
+for module in ("jieba", "pypinyin", "numpy", "torch", "transformers", "soundfile", "pydub", "tqdm"):
+    pytest.importorskip(module)
+
+import main
+from converter.dialect_converter import XianDialectConverter
+from utils.io_utils import JsonlWriter, load_done_paths
+
+class _FailingExtractor:
+    """批量提取时整批报错、逐条重试时只有 bad.wav 失败的BERT提取器"""
+    def extract_batch(self, texts, initials, finals, paths, counts=None):
+        raise RuntimeError("CUDA out of memory")
+
+    def extract_features(self, text, initials, finals, output_path, counts=None):
+        if "bad" in output_path:
+            raise RuntimeError("tokenizer error")
+        return True
+
+def test_rows_without_bert_features_are_not_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "get_audio_duration", lambda filepath: 1.0)
+    items = [("wavs/ok1.wav", "西安"), ("wavs/bad.wav", "你好"), ("wavs/ok2.wav", "好的")]
+    output = tmp_path / "manifest.json"
+    writer = JsonlWriter(str(output))
+    main.process_audio_files(items, writer, XianDialectConverter(), _FailingExtractor(), str(tmp_path / "bert"))
+    writer.close()
+    assert load_done_paths(str(output)) == {"wavs/ok1.wav", "wavs/ok2.wav"}
@@ -0,0 +1,34 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("librosa")
+pytest.importorskip("soundfile")
+
+from features.mel_processor import EPSILON, MelSpectrogramGenerator
+
+def _reference_log_mel(generator, audio):
+    """与 TTSDataset.get_log_mel 相同：逐条音频 torch.stft(center=True)"""
+    spec = torch.stft(
+        torch.as_tensor(audio),
+        n_fft=generator.n_fft,
+        hop_length=generator.hop_len,
+        win_length=generator.win_length,
+        window=generator.window,
+        center=True,
+        return_complex=True,
+    )
+    spec = torch.view_as_real(spec)
+    spec = torch.sqrt(spec.pow(2).sum(-1) + EPSILON)
+    mel = torch.matmul(generator.fb, spec)
+    return torch.log(torch.clamp(mel, min=torch.finfo(mel.dtype).tiny)).numpy()
+
+def test_batched_log_mel_matches_per_clip_stft():
+    generator = MelSpectrogramGenerator(n_fft=1024, win_length=1024, hop_length=256, n_mels=80, highfreq=8000)
+    rng = np.random.default_rng(0)
+    # 长度不同且不是帧移整数倍的音频放在同一批中
+    audios = [rng.standard_normal(n).astype(np.float32) * 0.1 for n in (22050, 5000, 1023, 12345)]
+    for audio, log_mel in zip(audios, generator.compute(audios)):
+        expected = _reference_log_mel(generator, audio)
+        assert log_mel.shape == expected.shape
+        np.testing.assert_allclose(log_mel, expected, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+方言转换器微基准测试
+对比逐字规则判断与预编译音节查找表的耗时，并校验两者结果一致；
+对比重新解析音素字符串与直接使用结构化转换结果（ConversionResult）的耗时；
+--cold_start 测量新进程中首次生成与读取已有 jieba 词典缓存时的冷启动耗时
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from pypinyin import lazy_pinyin, Style
+
+# 允许从 data_processor 目录外直接运行本脚本
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from converter.dialect_converter import XianDialectConverter
+from converter.phonetic_rules import INITIAL_RULES, FINAL_RULES, TONE_RULES
+
+
+def load_texts(text_path, transcript=False):
+    """读取文本文件，每行一句；transcript=True 时按"音频路径 文本"格式去掉第一列"""
+    texts = []
+    with open(text_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if transcript:
+                parts = line.split(' ', 1)
+                line = parts[1] if len(parts) == 2 else ""
+            if line:
+                texts.append(line)
+    return texts
+
+
+def timeit(fn, repeat):
+    """运行 repeat 次，返回最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def legacy_apply_phonological_rules(orig_initials, orig_finals):
+    """原 XianDialectConverter._apply_phonological_rules：逐字按 if/elif 与列表成员判断应用西安方言规则"""
+    trans_initials = []
+    trans_finals = []
+
+    for c, v in zip(orig_initials, orig_finals):
+        initial, final = "", ""
+
+        # 提取声调
+        if v and v[-1] in "12345":
+            tone = v[-1]
+            v_without_tone = v[:-1]
+        else:
+            tone = "5"  # 默认为轻声
+            v_without_tone = v
+
+        # 转换声母
+        if c in ['y','w',''] and v_without_tone in ['e', 'ai', 'ei', 'ao', 'an', 'en', 'ang', 'ou']:
+            initial = 'ŋ'
+        elif c in INITIAL_RULES:
+            initial = INITIAL_RULES[c]
+        else:
+            initial = c
+
+        # 转换韵母(特殊规则优先)
+        if c in ['z', 'c', 's'] and v_without_tone == 'i':
+            final = 'ɿ'
+        elif c in ['zh', 'ch', 'sh', 'r'] and v_without_tone == 'i':
+            final = 'ʅ'
+        elif c in ['j','q','x'] and v_without_tone == 'un':
+            final = 'yẽ'
+        elif c in ['j','q','x'] and v_without_tone == 'uan':
+            final = 'yã'
+        elif v_without_tone in FINAL_RULES:
+            final = FINAL_RULES[v_without_tone]
+        else:
+            final = v_without_tone
+
+        # 添加声调
+        if tone in TONE_RULES:
+            final += TONE_RULES[tone]
+
+        trans_initials.append(initial)
+        trans_finals.append(final)
+
+    return trans_initials, trans_finals
+
+
+def benchmark_syllable_rules(converter, texts, repeat):
+    """原先逐字的 if/elif 规则判断 vs 预编译查找表（converter 须使用默认的西安方言规则）"""
+    initials, finals = [], []
+    for text in texts:
+        initials.extend(lazy_pinyin(text, neutral_tone_with_five=True, style=Style.INITIALS))
+        finals.extend(lazy_pinyin(text, neutral_tone_with_five=True, style=Style.FINALS_TONE3))
+    pairs = list(zip(initials, finals))
+    print(f"音节数: {len(pairs)}")
+
+    rule_walk = lambda: legacy_apply_phonological_rules(initials, finals)
+    table = lambda: converter._apply_phonological_rules(initials, finals)
+
+    assert rule_walk() == table(), "查找表结果与原先的规则判断不一致"
+
+    t_rules = timeit(rule_walk, repeat)
+    t_table = timeit(table, repeat)
+    print(f"逐字规则判断: {t_rules * 1000:.1f} ms")
+    print(f"预编译查找表: {t_table * 1000:.1f} ms")
+    print(f"加速比: {t_rules / max(t_table, 1e-9):.2f}x")
+
+
+def legacy_phoneme_length(phoneme_text):
+    """原 main.py 中按空格切分音素表示计算音素长度的实现"""
+    phoneme_length = []
+    for char in phoneme_text.split(" "):
+        if '@' in char:
+            phoneme_length.append(len(char)-1)
+        elif char in "，。、？!,.?":
+            phoneme_length.append(len(char)+1)
+        else:
+            phoneme_length.append(len(char))
+    return phoneme_length
+
+
+def legacy_expand(text, initials, finals, res):
+    """原 BertFeatureExtractor 中由声母韵母逐字重新推导展开方式的实现"""
+    _vecs = []
+    for _o, _c, _vec in zip(zip(initials, finals), text, res[1:-1]):
+        if _o[0] != _o[1] and _o[0] != '':
+            _vecs.extend([_vec]*2)
+        elif _o[0] != _o[1] and _o[0] == '':
+            _vecs.append(_vec)
+        else:
+            _vecs.extend([_vec]*len(_o[0]))
+    return np.stack([res[0]] + _vecs + [res[-1]])
+
+
+def structured_expand(text, counts, res):
+    """与 BertFeatureExtractor._expand 相同：按每个字的音素数重复展开"""
+    n = min(len(counts), len(text), res.shape[0] - 2)
+    return np.concatenate([res[:1], np.repeat(res[1:n + 1], counts[:n], axis=0), res[-1:]])
+
+
+def benchmark_structured_result(converter, texts, repeat, dim):
+    """重新解析字符串（音素长度 + BERT展开） vs 直接使用 ConversionResult"""
+    conversions = converter.convert_many(texts)
+    # 用随机矩阵代替BERT输出，所有句子共用一块内存
+    res_all = np.random.rand(max(len(t) for t in texts) + 2, dim).astype(np.float32)
+    jobs = [(t, c, res_all[:len(t) + 2]) for t, c in zip(texts, conversions)]
+
+    def reparse():
+        return [(legacy_phoneme_length(c.phoneme_text), legacy_expand(t, c.initials, c.finals, res))
+                for t, c, res in jobs]
+
+    def structured():
+        return [(c.phoneme_lengths, structured_expand(t, c.expansion_counts, res)) for t, c, res in jobs]
+
+    for (l1, v1), (l2, v2) in zip(reparse(), structured()):
+        assert l1 == l2 and np.array_equal(v1, v2), "结构化结果与重新解析的结果不一致"
+
+    t_reparse = timeit(reparse, repeat)
+    t_structured = timeit(structured, repeat)
+    print(f"重新解析字符串: {t_reparse * 1000:.1f} ms")
+    print(f"结构化转换结果: {t_structured * 1000:.1f} ms")
+    print(f"加速比: {t_reparse / max(t_structured, 1e-9):.2f}x")
+
+
+COLD_START_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from converter.frontend import PinyinFrontend
+from converter.dialect_converter import XianDialectConverter
+from converter.phonetic_rules import INITIAL_RULES, FINAL_RULES, TONE_RULES
+frontend = PinyinFrontend(cache_file={cache_file!r}, warm_up=True)
+XianDialectConverter(frontend=frontend).convert("西安方言语音合成")
+print(time.perf_counter() - start)
+"""
+
+
+def cold_start(cache_file):
+    """在新的Python进程中导入转换器并转换第一句话，返回耗时（秒，不含解释器启动）"""
+    script = COLD_START_SCRIPT.format(root=ROOT, cache_file=cache_file)
+    out = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def benchmark_cold_start(jieba_cache, repeat):
+    """首次生成词典缓存（每次使用新的缓存文件） vs 读取已有的词典缓存
+
+    jieba 默认已把缓存放在临时目录中，--jieba_cache 只改变缓存的位置，这里的对比用于确认
+    缓存所在的磁盘不会拖慢启动，而不是为了得到加速。
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        t_cold = float("inf")
+        for i in range(repeat):
+            t_cold = min(t_cold, cold_start(os.path.join(tmp_dir, f"jieba_{i}.cache")))
+
+        jieba_cache = jieba_cache or os.path.join(tmp_dir, "jieba.cache")
+        cold_start(jieba_cache)  # 生成缓存
+        t_cached = min(cold_start(jieba_cache) for _ in range(repeat))
+
+    print(f"冷启动（生成词典缓存）: {t_cold * 1000:.0f} ms")
+    print(f"冷启动（读取词典缓存）: {t_cached * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="方言转换器微基准测试")
+    parser.add_argument("text_path", nargs="?", help="测试文本路径，每行一句")
+    parser.add_argument("--transcript", action="store_true", help="输入为\"音频路径 文本\"格式的转录文件")
+    parser.add_argument("--repeat", type=int, default=5, help="每项测试重复次数，取最短耗时，默认为5")
+    parser.add_argument("--bert_dim", type=int, default=1024, help="模拟的BERT特征维度，默认为1024")
+    parser.add_argument("--cold_start", action="store_true", help="测试新进程的冷启动耗时")
+    parser.add_argument("--jieba_cache", help="冷启动测试使用的jieba词典缓存文件，默认使用临时文件")
+
+    args = parser.parse_args()
+
+    if args.cold_start:
+        benchmark_cold_start(args.jieba_cache, args.repeat)
+    if args.text_path is None:
+        if not args.cold_start:
+            parser.error("text_path is required unless --cold_start is given")
+        return
+
+    texts = load_texts(args.text_path, args.transcript)
+    print(f"句子数: {len(texts)}")
+
+    converter = XianDialectConverter()
+    benchmark_syllable_rules(converter, texts, args.repeat)
+    benchmark_structured_result(converter, texts, args.repeat, args.bert_dim)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,53 @@
 """
 
 import os
+import sys
 import json
 import argparse
-import soundfile as sf  # 用于读取音频文件 [[0]](#__0)
 from tqdm import tqdm  # 进度条显示 [[1]](#__1)
 import numpy as np  # 数组处理 [[2]](#__2)
 
+# 允许从 data_processor 目录外直接运行本脚本
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features.audio_processor import get_audio_durations  # 只读取文件头获取时长
 
-def generate_metadata(audio_dir, output_dir, mel_dir=None, val_ratio=0.1):
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac")
+
+
+def list_audio_files(audio_dir):
+    """一次 os.scandir 列出目录下的音频文件（按文件名排序）"""
+    with os.scandir(audio_dir) as it:
+        return sorted(e.name for e in it if e.name.endswith(AUDIO_EXTENSIONS) and e.is_file())
+
+
+def list_mel_stems(mel_dir):
+    """一次 os.scandir 得到已有梅尔频谱图的文件名（不含扩展名）集合，代替逐个 os.path.exists"""
+    if not os.path.isdir(mel_dir):
+        return set()
+    with os.scandir(mel_dir) as it:
+        return {e.name[:-len(".npy")] for e in it if e.name.endswith(".npy")}
+
+
+def load_mel_config(config_path):
+    """从 FastPitch 训练配置（yaml）的 model 部分读取梅尔频谱参数，返回与命令行参数同名的字典"""
+    from omegaconf import OmegaConf  # 随NeMo安装，只在指定配置文件时导入
+
+    model = OmegaConf.load(config_path).model
+    return {
+        "sample_rate": model.sample_rate,
+        "n_fft": model.n_fft,
+        "win_length": model.n_window_size,
+        "hop_length": model.n_window_stride,
+        "n_mels": model.n_mel_channels,
+        "lowfreq": model.lowfreq,
+        "highfreq": model.highfreq,
+        "window": model.window,
+    }
+
+
+def generate_metadata(audio_dir, output_dir, mel_dir=None, val_ratio=0.1, num_workers=8, use_processes=False,
+                      mel_generator=None):
     """
     生成训练和验证集的元数据文件
     
@@ -21,6 +60,9 @@ def generate_metadata(audio_dir, output_dir, mel_dir=None, val_ratio=0.1):
         output_dir: 输出元数据文件目录
         mel_dir: 梅尔频谱图目录，默认与音频目录相同，但文件扩展名为.npy
         val_ratio: 验证集比例，默认为0.1
+        num_workers: 读取音频时长的并行线程（进程）数，默认为8
+        use_processes: 使用进程池而不是线程池读取音频时长
+        mel_generator: MelSpectrogramGenerator，指定时为缺失的梅尔频谱图批量生成文件
     """
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
@@ -30,7 +72,7 @@ def generate_metadata(audio_dir, output_dir, mel_dir=None, val_ratio=0.1):
         mel_dir = audio_dir
     
     # 获取所有音频文件
-    audio_files = [f for f in os.listdir(audio_dir) if f.endswith((".wav", ".mp3", ".flac"))]
+    audio_files = list_audio_files(audio_dir)
     print(f"找到 {len(audio_files)} 个音频文件")
     
     # 计算训练集和验证集的分割点
@@ -41,23 +83,31 @@ def generate_metadata(audio_dir, output_dir, mel_dir=None, val_ratio=0.1):
     train_manifest_path = os.path.join(output_dir, "train_manifest_mel.json")
     val_manifest_path = os.path.join(output_dir, "val_manifest_mel.json")
     
+    # 批量读取音频时长（WAV/FLAC只解析文件头）
+    audio_paths = [os.path.join(audio_dir, f) for f in audio_files]
+    durations = get_audio_durations(audio_paths, num_workers=num_workers, use_processes=use_processes)
+
+    # 已有的梅尔频谱图
+    mel_stems = list_mel_stems(mel_dir)
+    missing_mels = []
+    missing_audios = []
+
     # 处理所有音频文件并生成元数据
     metadata = []
-    for audio_file in tqdm(audio_files, desc="处理音频文件"):
-        audio_path = os.path.join(audio_dir, audio_file)
+    for audio_file, audio_path, duration in tqdm(zip(audio_files, audio_paths, durations), total=len(audio_files), desc="处理音频文件"):
         try:
-            # 读取音频文件并计算持续时间
-            audio_data, sample_rate = sf.read(audio_path)  # [[0]](#__0)
-            duration = round(len(audio_data) / sample_rate, 3)
-            
+            if duration is None:
+                raise ValueError("无法读取音频时长")
+            duration = round(duration, 3)
+
             # 构建对应的梅尔频谱图路径
-            mel_file = os.path.splitext(audio_file)[0] + ".npy"
-            mel_path = os.path.join(mel_dir, mel_file)
+            stem = os.path.splitext(audio_file)[0]
+            mel_path = os.path.join(mel_dir, stem + ".npy")
             
             # 检查梅尔频谱图文件是否存在
-            if not os.path.exists(mel_path):
-                print(f"警告: 未找到梅尔频谱图文件 {mel_path}")
-                # 如果需要，可以在这里添加生成梅尔频谱图的代码
+            if stem not in mel_stems:
+                missing_mels.append(mel_path)
+                missing_audios.append(audio_path)
             
             # 创建元数据条目
             entry = {
@@ -69,6 +119,18 @@ def generate_metadata(audio_dir, output_dir, mel_dir=None, val_ratio=0.1):
         except Exception as e:
             print(f"处理文件 {audio_path} 时出错: {e}")
     
+    if missing_mels and mel_generator is not None:
+        print(f"为 {len(missing_mels)} 个缺失的梅尔频谱图生成文件")
+        os.makedirs(mel_dir, exist_ok=True)
+        mel_generator.generate(missing_audios, missing_mels, num_workers=num_workers)
+        mel_stems = list_mel_stems(mel_dir)
+        missing_mels = [p for p in missing_mels if os.path.splitext(os.path.basename(p))[0] not in mel_stems]
+
+    if missing_mels:
+        print(f"警告: {len(missing_mels)} 个梅尔频谱图文件不存在，例如:")
+        for mel_path in missing_mels[:10]:
+            print(f"  {mel_path}")
+
     # 打乱数据顺序以确保随机分割
     np.random.seed(42)  # 设置随机种子以确保可重复性 [[2]](#__2)
     np.random.shuffle(metadata)
@@ -99,14 +161,49 @@ def main():
     parser.add_argument("--output_dir", required=True, help="输出元数据文件目录")
     parser.add_argument("--mel_dir", help="梅尔频谱图目录，默认与音频目录相同")
     parser.add_argument("--val_ratio", type=float, default=0.1, help="验证集比例，默认为0.1")
+    parser.add_argument("--num_workers", type=int, default=8, help="读取音频时长的并行线程（进程）数，默认为8")
+    parser.add_argument("--use_processes", action="store_true", help="使用进程池读取音频时长（文件很多时更快）")
+    parser.add_argument("--generate_missing_mels", action="store_true",
+                        help="为缺失的梅尔频谱图批量生成文件（与TTSDataset.get_log_mel相同的配置）")
+    parser.add_argument("--device", default="cpu", help="生成梅尔频谱图的设备 (例如 'cuda:0', 'cpu')")
+    parser.add_argument("--config", help="FastPitch训练配置（yaml），从中读取以下梅尔频谱参数，命令行中显式给出的参数优先")
+    parser.add_argument("--sample_rate", type=int, default=22050, help="采样率，默认为22050")
+    parser.add_argument("--n_fft", type=int, default=1024, help="FFT点数，默认为1024")
+    parser.add_argument("--win_length", type=int, default=1024, help="窗长，默认为1024")
+    parser.add_argument("--hop_length", type=int, default=256, help="帧移，默认为256")
+    parser.add_argument("--n_mels", type=int, default=80, help="梅尔滤波器个数，默认为80")
+    parser.add_argument("--lowfreq", type=int, default=0, help="梅尔滤波器最低频率，默认为0")
+    parser.add_argument("--highfreq", type=int, default=8000, help="梅尔滤波器最高频率，默认为8000")
+    parser.add_argument("--window", default="hann", help="窗函数，默认为hann")
     
+    args, _ = parser.parse_known_args()
+    if args.config:
+        parser.set_defaults(**load_mel_config(args.config))
     args = parser.parse_args()
+
+    mel_generator = None
+    if args.generate_missing_mels:
+        from features.mel_processor import MelSpectrogramGenerator  # 依赖torch/librosa，只在需要时导入
+        mel_generator = MelSpectrogramGenerator(
+            sample_rate=args.sample_rate,
+            n_fft=args.n_fft,
+            win_length=args.win_length,
+            hop_length=args.hop_length,
+            n_mels=args.n_mels,
+            lowfreq=args.lowfreq,
+            highfreq=args.highfreq,
+            window=args.window,
+            device=args.device,
+        )
     
     generate_metadata(
         audio_dir=args.audio_dir,
         output_dir=args.output_dir,
         mel_dir=args.mel_dir,
-        val_ratio=args.val_ratio
+        val_ratio=args.val_ratio,
+        num_workers=args.num_workers,
+        use_processes=args.use_processes,
+        mel_generator=mel_generator
     )
 
 
@@ -1,17 +1,68 @@
 import os
+import glob
 import json
+import zlib
 
-def load_transcript_dict(text_path):
+def parse_shard(spec):
+    """解析 "i/N" 形式的分片参数，返回 (i, N)"""
+    try:
+        index, num_shards = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard {spec}, expected i/N")
+    if not 0 <= index < num_shards:
+        raise ValueError(f"Invalid shard {spec}, expected 0 <= i < N")
+    return index, num_shards
+
+def in_shard(filename, shard):
+    """按音频路径的CRC32确定性地分片，与输入文件的顺序和划分方式无关"""
+    if shard is None:
+        return True
+    index, num_shards = shard
+    return zlib.crc32(filename.encode("utf-8")) % num_shards == index
+
+def _iter_transcript_lines(paths, shard):
+    """依次产出 (位置, 音频路径, 文本)，位置为 (文件序号, 行号)"""
+    for file_index, path in enumerate(paths):
+        with open(path, encoding="utf-8") as f:
+            for line_index, line in enumerate(f):
+                try:
+                    filename, text = line.strip().split(' ', 1)  # 只在第一个空格处分割
+                except ValueError:
+                    continue
+                if in_shard(filename, shard):
+                    yield (file_index, line_index), filename, text
+
+def iter_transcripts(text_paths, shard=None):
+    """逐行读取转录文本，依次产出 (音频路径, 文本)
+
+    text_paths 可以是单个路径或路径列表，支持通配符（匹配结果按文件名排序）。
+    shard=(i, N) 时只产出属于第i个分片的条目。
+    同一音频路径出现多次时与原先读入字典的结果相同：条目在第一次出现的位置产出，文本以最后一次出现的为准
+    （例如追加在末尾的更正）。为此先扫描一遍，内存中只保存各路径第一次出现的位置和重复路径的最后文本。
+    """
+    if isinstance(text_paths, str):
+        text_paths = [text_paths]
+    paths = []
+    for pattern in text_paths:
+        paths.extend(sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern])
+
+    first = {}  # 音频路径 -> 第一次出现的位置
+    corrections = {}  # 重复出现的音频路径 -> 最后一次出现的文本
+    for position, filename, text in _iter_transcript_lines(paths, shard):
+        if filename in first:
+            corrections[filename] = text
+        else:
+            first[filename] = position
+    if corrections:
+        print(f"转录文本中有 {len(corrections)} 个音频路径重复出现，以最后一次出现的文本为准")
+
+    for position, filename, text in _iter_transcript_lines(paths, shard):
+        if first[filename] == position:
+            yield filename, corrections.get(filename, text)
+
+def load_transcript_dict(text_path, shard=None):
     """从文本文件加载转录字典"""
-    trans_dict = {}
-    with open(text_path) as f:
-        for line in f.readlines():
-            try:
-                filename, text = line.strip().split(' ', 1)  # 只在第一个空格处分割
-                trans_dict[filename] = text
-            except ValueError:
-                continue
-    return trans_dict
+    return dict(iter_transcripts(text_path, shard))
 
 def save_json(data, output_path):
     """保存结果为 JSON 文件，每行一个JSON对象"""
@@ -19,6 +70,67 @@ def save_json(data, output_path):
         for line in data:
             f.writelines(json.dumps(line, ensure_ascii=False)+'\n')
 
+class JsonlWriter:
+    """流式写出JSONL清单，每行一个JSON对象
+
+    写入的行先缓存在内存中，每累计 sync_every 行落盘一次：先调用 on_sync
+    （例如落盘对应的BERT特征），再追加这些行并 fsync，保证清单中出现的条目
+    其特征已经写出。resume=True 时在已有文件末尾追加。
+    """
+    def __init__(self, output_path, resume=False, sync_every=1000, on_sync=None):
+        self.output_path = output_path
+        self.sync_every = sync_every
+        self.on_sync = on_sync
+        self.count = 0
+        self._buffer = []
+        self._file = open(output_path, "a" if resume else "w", encoding="utf-8")
+
+    def write(self, item):
+        self._buffer.append(json.dumps(item, ensure_ascii=False) + '\n')
+        self.count += 1
+        if len(self._buffer) >= self.sync_every:
+            self.flush()
+
+    def flush(self):
+        if self.on_sync is not None:
+            self.on_sync()
+        if self._buffer:
+            self._file.write(''.join(self._buffer))
+            self._buffer.clear()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+def load_done_paths(output_path):
+    """读取已有的JSONL清单，返回其中的音频路径集合，用于断点续跑
+
+    中断时可能留下不完整的最后一行，该行会被截掉，之后可直接追加写入。
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    valid_size = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError("truncated line")
+                item = json.loads(line)
+            except ValueError:
+                break
+            done.add(item["audio_filepath"])
+            valid_size += len(line)
+    if valid_size != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_size)
+    return done
+
 def ensure_dir(dir_path):
     """确保目录存在"""
     os.makedirs(dir_path, exist_ok=True)